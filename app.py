@@ -1,12 +1,52 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, after_this_request, session
+import time
+# Startup timing for /ready and /metrics; taken before the heavy imports below
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, render_template, request, redirect, url_for, send_file, flash, session, stream_with_context
+import click
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
+import csv
+import difflib
+import functools
+import hashlib
+import hmac
+import html
+import io
 import json
+import multiprocessing
 import os
+import queue
+import re
+import shutil
+import socket
+import sqlite3
+import xmlrpc.client
 import zipfile
+import zlib
 from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.image.exceptions import UnrecognizedImageError
+from docx.image.image import Image as DocxImage
+from docx.oxml.simpletypes import ST_Merge
+from docx.shared import Mm
+from docx.text.font import Font
+from docx.text.parfmt import ParagraphFormat
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from docxcompose.composer import Composer
-from docx2pdf import convert
-from datetime import datetime
+from datetime import date, datetime
 import subprocess
+import sys
+import threading
+import types
+import uuid
 
 app = Flask(__name__)
 app.secret_key = 'police_gujarat_secure_key'
@@ -24,42 +64,245 @@ app.secret_key = 'police_gujarat_secure_key'
 # Configuration
 import tempfile
 TEMPLATE_DIR = 'word_templates'
+# Root for per-request scratch directories (only PDF conversion touches disk)
 GENERATED_DIR = tempfile.gettempdir()
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Placeholder manifest for everything under TEMPLATE_DIR (`flask build-index`)
+PLACEHOLDER_INDEX_FILE = 'template_index.json'
+# Bumped when template scanning changes, so older manifests are rebuilt
+PLACEHOLDER_INDEX_FORMAT = 4
+# Optimized template copies and their placeholder positions (`flask precompile`)
+PRECOMPILED_DIR = os.environ.get('PRECOMPILED_DIR', 'compiled_templates')
+# Sections, aliases and per-template options; see DOCUMENT MAPPING LOGIC
+REGISTRY_MANIFEST = os.path.join(TEMPLATE_DIR, 'offences.json')
+# Seconds between checks of TEMPLATE_DIR for added or removed templates
+REGISTRY_CHECK_INTERVAL = float(os.environ.get('REGISTRY_CHECK_INTERVAL', '2'))
+
+# PDF conversion: number of long-lived LibreOffice workers (needs `unoserver`
+# on PATH, 0 disables the pool) and the limits applied to their job queue.
+# Worker i listens on PDF_WORKER_BASE_PORT + i (and 1000 above for UNO); each
+# process needs its own range, which gunicorn.conf.py hands out per worker
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+PDF_WORKER_BASE_PORT = int(os.environ.get('PDF_WORKER_BASE_PORT', '2003'))
+PDF_QUEUE_SIZE = int(os.environ.get('PDF_QUEUE_SIZE', '32'))
+PDF_QUEUE_TIMEOUT = 5
+PDF_CONVERT_TIMEOUT = 120
+PDF_WORKER_START_TIMEOUT = 60
+PDF_HEALTH_INTERVAL = 30
+
+# Gujarati-capable TrueType fonts for the direct PDF engine, first match wins
+PDF_FONT_CANDIDATES = [
+    os.environ.get('PDF_FONT_PATH', ''),
+    os.path.join('static', 'fonts', 'NotoSansGujarati-Regular.ttf'),
+    '/usr/share/fonts/truetype/noto/NotoSansGujarati-Regular.ttf',
+    '/usr/share/fonts/opentype/noto/NotoSansGujarati-Regular.ttf',
+    r'C:\Windows\Fonts\shruti.ttf',
+]
+PDF_BOLD_FONT_CANDIDATES = [
+    os.environ.get('PDF_BOLD_FONT_PATH', ''),
+    os.path.join('static', 'fonts', 'NotoSansGujarati-Bold.ttf'),
+    '/usr/share/fonts/truetype/noto/NotoSansGujarati-Bold.ttf',
+    '/usr/share/fonts/opentype/noto/NotoSansGujarati-Bold.ttf',
+    r'C:\Windows\Fonts\shrutib.ttf',
+]
+
+# Threads used to fill the templates of a section concurrently
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '4'))
+# Added to ZIP downloads when some documents could not be produced
+FAILURE_REPORT_NAME = 'FAILED_DOCUMENTS.txt'
+# Merged PDF: "concat" converts each template on its own (reusing cached
+# single-document PDFs) and joins them with pypdf, adding a bookmark and page
+# labels per document; "docx" converts the merged DOCX in one go. concat falls
+# back to docx when pypdf isn't installed.
+MERGED_PDF_MODE = os.environ.get('MERGED_PDF_MODE', 'concat')
+
+# Server-side case storage; the session cookie only carries the case ID
+CASE_DB_PATH = os.environ.get('CASE_DB_PATH', os.path.join('data', 'cases.db'))
+CASE_CACHE_SIZE = 256
+# Shared key that unlocks other people's cases (/api/cases) for a browser
+# session; unset, only the session's own case is reachable
+CASE_ACCESS_KEY = os.environ.get('CASE_ACCESS_KEY', '')
+# Rows returned by the past-case search (/api/cases/search)
+CASE_SEARCH_LIMIT = 10
+
+# Uploaded photos and signatures, stored under their content hash; copies
+# downscaled for each frame size are kept in IMAGE_DIR/resized
+IMAGE_DIR = os.environ.get('IMAGE_DIR', os.path.join('data', 'images'))
+MAX_IMAGE_BYTES = 16 * 1024 * 1024
+# Resolution images are downscaled to for their frame (needs Pillow)
+IMAGE_DPI = int(os.environ.get('IMAGE_DPI', '200'))
+
+# Processes used by bulk generation (/api/bulk_generate, `flask bulk-generate`)
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', str(os.cpu_count() or 2)))
+
+# Stage timings and counters served at /metrics; METRICS=0 turns recording off.
+# SERVER_TIMING=1 also reports each request's stages in a Server-Timing header
+METRICS_ENABLED = os.environ.get('METRICS', '1') != '0'
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+# Background generation jobs (/api/jobs): worker threads, how many may be
+# queued or running at once, and seconds a finished job's result is kept.
+# JOB_DIR holds each job's state and result; every process serving the app
+# must see the same directory
+JOB_DIR = os.environ.get('JOB_DIR', os.path.join(GENERATED_DIR, 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '16'))
+JOB_TTL = int(os.environ.get('JOB_TTL', '1800'))
+
+# Generated documents are reused for identical (template, data, format); the
+# cache lives in memory unless OUTPUT_CACHE_DIR points at a local directory
+OUTPUT_CACHE_BYTES = int(os.environ.get('OUTPUT_CACHE_BYTES', str(64 * 1024 * 1024)))
+OUTPUT_CACHE_DIR = os.environ.get('OUTPUT_CACHE_DIR', '')
+
+# Text responses at least this many bytes are compressed with brotli (when
+# the package is installed) or gzip for clients that accept it; 0 turns it off
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+# Seconds browsers may keep files under /static without asking again
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(7 * 24 * 3600)))
 
 # --------------------------------------------------
 # DOCUMENT MAPPING LOGIC
 # --------------------------------------------------
-OFFENCE_MAPPING = {
-    "281": [
-        "Arrest_memo_281.docx",
-        "Bail_Bond_281.docx",
-        "Notice_281.docx"
-    ],
-    "302": [
-        "Arrest_Memo_Major.docx",
-        "Remand_Application.docx",
-        "Panchnama_Scene.docx"
-    ],
-    "379": [
-        "Arrest_Memo_Theft.docx",
-        "Recovery_Panchnama.docx"
-    ],
-    "GENERAL": [
-        "Standard_Intimation.docx"
-    ]
-}
+# Each sub-directory of TEMPLATE_DIR is an offence section holding its
+# templates. REGISTRY_MANIFEST adds, per section, a label, aliases (the same
+# offence under IPC and BNS numbering) and the template order, plus
+# per-template options:
+#   pdf_engine: "office" (default) converts the filled DOCX with LibreOffice/Word;
+#               "direct" draws the PDF straight from the filled document with
+#               ReportLab, falling back to office when that isn't available
+#   title: bookmark and page label name in the merged PDF (default: file name)
+# Sections the case doesn't match fall back to DEFAULT_SECTION.
+DEFAULT_SECTION = 'GENERAL'
+
+def normalize_section(name):
+    """'ipc-379', 'IPC 379' and ' IPC379 ' all become 'IPC 379'"""
+    name = re.sub(r'([A-Z])(?=[0-9])', r'\1 ', str(name).upper())
+    return " ".join(re.findall(r'[0-9A-Z]+', name))
+
+class TemplateRegistry:
+    """Immutable snapshot of sections, their templates, aliases and options.
+
+    Every lookup is a dict access; a changed directory or manifest produces a
+    new registry rather than modifying this one.
+    """
+
+    def __init__(self, sections, options, signature=None):
+        self.sections = sections  # section -> {"label", "aliases", "templates"}
+        self.options = options    # filename -> {option: value}
+        self.signature = signature
+        self.aliases = {}
+        self.template_sections = {}
+        for section, entry in sections.items():
+            for name in [section, *entry['aliases']]:
+                self.aliases.setdefault(normalize_section(name), section)
+            for filename in entry['templates']:
+                self.template_sections.setdefault(filename, section)
+
+    def resolve(self, section):
+        """Canonical section for a name or alias, None if unknown"""
+        if not section:
+            return None
+        return self.aliases.get(normalize_section(section))
+
+    def templates(self, section):
+        section = self.resolve(section) or DEFAULT_SECTION
+        return self.sections.get(section, {}).get('templates', [])
+
+def registry_signature():
+    """mtimes of TEMPLATE_DIR, its section directories and the manifest"""
+    signature = []
+    for path in [TEMPLATE_DIR, REGISTRY_MANIFEST]:
+        try:
+            signature.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            signature.append((path, None))
+    try:
+        entries = sorted(os.scandir(TEMPLATE_DIR), key=lambda e: e.name)
+    except OSError:
+        entries = []
+    for entry in entries:
+        if entry.is_dir() and not entry.name.startswith('.'):
+            signature.append((entry.name, entry.stat().st_mtime_ns))
+    return tuple(signature)
+
+def build_template_registry(signature=None):
+    """Scan TEMPLATE_DIR and read REGISTRY_MANIFEST into a TemplateRegistry"""
+    try:
+        with open(REGISTRY_MANIFEST, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    on_disk = {}
+    if os.path.isdir(TEMPLATE_DIR):
+        for name in sorted(os.listdir(TEMPLATE_DIR)):
+            path = os.path.join(TEMPLATE_DIR, name)
+            if os.path.isdir(path) and not name.startswith('.'):
+                on_disk[name] = sorted(
+                    f for f in os.listdir(path) if f.endswith('.docx') and not f.startswith('~$')
+                )
+
+    sections = {}
+    for section, conf in manifest.get('sections', {}).items():
+        # Listed templates keep their order; files dropped into the folder follow
+        templates = list(conf.get('templates', []))
+        templates += [f for f in on_disk.get(section, []) if f not in templates]
+        sections[section] = {
+            'label': conf.get('label', section),
+            'aliases': list(conf.get('aliases', [])),
+            'templates': templates,
+        }
+    for section, templates in on_disk.items():
+        if section not in sections:
+            sections[section] = {'label': section, 'aliases': [], 'templates': templates}
+    sections.setdefault(DEFAULT_SECTION, {'label': DEFAULT_SECTION, 'aliases': [], 'templates': []})
+    return TemplateRegistry(sections, manifest.get('templates', {}), signature)
+
+_registry = None
+_registry_checked = 0.0
+_registry_lock = threading.Lock()
+
+def template_registry():
+    """The current TemplateRegistry, rebuilt (and swapped in whole) when TEMPLATE_DIR changes"""
+    global _registry, _registry_checked
+    now = time.monotonic()
+    if _registry is not None and now - _registry_checked < REGISTRY_CHECK_INTERVAL:
+        return _registry
+    with _registry_lock:
+        if _registry is not None and now - _registry_checked < REGISTRY_CHECK_INTERVAL:
+            return _registry
+        signature = registry_signature()
+        if _registry is None or signature != _registry.signature:
+            try:
+                _registry = build_template_registry(signature)
+            except (OSError, ValueError):
+                if _registry is None:
+                    raise
+                # Keep serving the last good registry until the manifest is fixed
+                app.logger.exception("Could not reload %s", REGISTRY_MANIFEST)
+        _registry_checked = now
+    return _registry
+
+def section_templates(section):
+    """Templates for an offence section or alias, DEFAULT_SECTION's when unknown"""
+    return template_registry().templates(section)
+
+def template_option(filename, name, default=None):
+    return template_registry().options.get(filename, {}).get(name, default)
 
 def get_template_path(filename, section=None):
     """Get full path to template file, using section if provided"""
-    if section and section in OFFENCE_MAPPING:
-        return os.path.join(TEMPLATE_DIR, section, filename)
-    else:
-        # Try to find which section this file belongs to
-        for sec in OFFENCE_MAPPING:
-            if filename in OFFENCE_MAPPING[sec]:
-                return os.path.join(TEMPLATE_DIR, sec, filename)
-        # Fallback to root (for backwards compatibility)
-        return os.path.join(TEMPLATE_DIR, filename)
+    registry = template_registry()
+    resolved = registry.resolve(section)
+    if resolved:
+        return os.path.join(TEMPLATE_DIR, resolved, filename)
+    # Try to find which section this file belongs to
+    resolved = registry.template_sections.get(filename)
+    if resolved:
+        return os.path.join(TEMPLATE_DIR, resolved, filename)
+    # Fallback to root (for backwards compatibility)
+    return os.path.join(TEMPLATE_DIR, filename)
 
 # --------------------------------------------------
 # DATA VARIABLES LIST (For validation and cleaning)
@@ -98,281 +341,3165 @@ REQUIRED_FIELDS = [
     "auth_date", "auth_place", "auth_print_name"
 ]
 
+# Image fields hold the ID of an uploaded image (/api/images) and go into
+# templates as [img:acc_photo], or [img:acc_photo:30x40] for a frame in mm.
+# The default frame is given here; inside a table cell it shrinks to fit.
+IMAGE_FIELDS = {
+    "acc_photo": (35, 45),
+    "acc_signature": (50, 15),
+}
+
+# --------------------------------------------------
+# DERIVED FIELDS
+# --------------------------------------------------
+# Placeholders computed from other fields. Each has the fields it depends on
+# and a formatter taking their values in that order, returning "" when it
+# can't tell. For derived fields that are also in REQUIRED_FIELDS (acc_age,
+# crime_year, auth_date) a value the user typed wins. Values are computed
+# only for placeholders a template uses (placeholder_values) and formatters
+# are memoized on their inputs, so nothing is recomputed until one changes.
+# "today" is an input that is always available.
+GUJARATI_NUMERALS = str.maketrans("0123456789", "૦૧૨૩૪૫૬૭૮૯")
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+NUMBER_WORDS = (
+    "Zero One Two Three Four Five Six Seven Eight Nine Ten Eleven Twelve Thirteen "
+    "Fourteen Fifteen Sixteen Seventeen Eighteen Nineteen"
+).split()
+TENS_WORDS = "_ _ Twenty Thirty Forty Fifty Sixty Seventy Eighty Ninety".split()
+ORDINAL_WORDS = {"One": "First", "Two": "Second", "Three": "Third", "Five": "Fifth",
+                 "Eight": "Eighth", "Nine": "Ninth", "Twelve": "Twelfth"}
+MONTH_NAMES = ("January February March April May June July August September "
+               "October November December").split()
+# Fields entered with a date picker; each gets _dmy, _gu and _words variants
+DATE_FIELDS = ["acc_dob", "offence_date", "arrest_date", "bail_date",
+               "status_release_date", "intimation_date", "auth_date"]
+
+class DerivedField:
+    def __init__(self, depends, formatter):
+        self.depends = depends
+        self.formatter = functools.lru_cache(maxsize=1024)(formatter)
+
+def parse_date(value):
+    value = value.strip().translate(GUJARATI_DIGITS)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+def number_in_words(n):
+    """English words for 0 <= n < 10000, e.g. 2026 -> "Two Thousand Twenty-Six" """
+    if n < 20:
+        return NUMBER_WORDS[n]
+    if n < 100:
+        return TENS_WORDS[n // 10] + (f"-{NUMBER_WORDS[n % 10]}" if n % 10 else "")
+    if n < 1000:
+        return f"{NUMBER_WORDS[n // 100]} Hundred" + (f" {number_in_words(n % 100)}" if n % 100 else "")
+    return f"{NUMBER_WORDS[n // 1000]} Thousand" + (f" {number_in_words(n % 1000)}" if n % 1000 else "")
+
+def ordinal_in_words(n):
+    words = number_in_words(n)
+    head, _, last = words.rpartition("-")
+    if last in ORDINAL_WORDS:
+        last = ORDINAL_WORDS[last]
+    elif last.endswith("y"):
+        last = last[:-1] + "ieth"
+    else:
+        last += "th"
+    return f"{head}-{last}" if head else last
+
+def format_date(fmt):
+    """Formatter for one date rendering: "dmy" 18/10/2026, "gu" ૧૮/૧૦/૨૦૨૬, "words" """
+    def formatter(value):
+        day = parse_date(value)
+        if day is None:
+            return ""
+        if fmt == "words":
+            return f"{ordinal_in_words(day.day)} {MONTH_NAMES[day.month - 1]} {number_in_words(day.year)}"
+        text = day.strftime("%d/%m/%Y")
+        return text.translate(GUJARATI_NUMERALS) if fmt == "gu" else text
+    return formatter
+
+def age_on(dob, *reference_dates):
+    """Completed years from dob to the first reference date that is set"""
+    born = parse_date(dob)
+    on = next((d for d in map(parse_date, reference_dates) if d), None)
+    if born is None or on is None or on < born:
+        return ""
+    return str(on.year - born.year - ((on.month, on.day) < (born.month, born.day)))
+
+def year_of(value):
+    day = parse_date(value)
+    return str(day.year) if day else ""
+
+def join_address(house, area, village, taluka, district, state, pin):
+    parts = [house, area, village,
+             f"તા. {taluka}" if taluka else "", f"જિ. {district}" if district else "", state]
+    address = ", ".join(p.strip() for p in parts if p.strip())
+    return f"{address} - {pin.strip()}" if pin.strip() else address
+
+def join_words(*values):
+    return " ".join(v.strip() for v in values if v.strip())
+
+DERIVED_INPUTS = {"today": lambda: date.today().isoformat()}
+DERIVED_FIELDS = {
+    "acc_age": DerivedField(["acc_dob", "arrest_date", "offence_date", "today"], age_on),
+    "crime_year": DerivedField(["offence_date"], year_of),
+    "auth_date": DerivedField(["today"], format_date("dmy")),
+    "acc_full_name": DerivedField(["acc_name", "acc_father", "acc_surname"], join_words),
+    "perm_full_address": DerivedField(
+        ["perm_house", "perm_area", "perm_village", "perm_taluka", "perm_district", "perm_state", "perm_pin"],
+        join_address),
+    "curr_full_address": DerivedField(
+        ["curr_address", "curr_city", "curr_taluka", "curr_district", "curr_state", "curr_pin"],
+        lambda address, city, taluka, district, state, pin: join_address(
+            "", address, city, taluka, district, state, pin)),
+}
+for _field in DATE_FIELDS:
+    for _fmt in ("dmy", "gu", "words"):
+        DERIVED_FIELDS[f"{_field}_{_fmt}"] = DerivedField([_field], format_date(_fmt))
+
+# Every name a [placeholder] may use
+PLACEHOLDER_FIELDS = REQUIRED_FIELDS + [f for f in DERIVED_FIELDS if f not in REQUIRED_FIELDS]
+
+def field_value(data, name):
+    """A field's value for documents: what the user entered, else derived from its inputs"""
+    value = data.get(name)
+    if value or name not in DERIVED_FIELDS:
+        if value is None and name in DERIVED_INPUTS:
+            return DERIVED_INPUTS[name]()
+        return "" if value is None else str(value)
+    derived = DERIVED_FIELDS[name]
+    return derived.formatter(*(field_value(data, dep) for dep in derived.depends))
+
+def field_inputs(name):
+    """The entered fields a placeholder's value depends on, itself included when it can be entered"""
+    inputs = {name} if name in REQUIRED_FIELDS or name in IMAGE_FIELDS else set()
+    for dep in DERIVED_FIELDS[name].depends if name in DERIVED_FIELDS else ():
+        inputs |= field_inputs(dep)
+    return inputs
+
+def missing_inputs(data, name):
+    """Fields to ask for when a placeholder would come out empty"""
+    if name in REQUIRED_FIELDS or name not in DERIVED_FIELDS:
+        return {name}
+    missing = set()
+    for dep in DERIVED_FIELDS[name].depends:
+        if dep not in DERIVED_INPUTS and not field_value(data, dep):
+            missing |= missing_inputs(data, dep)
+    return missing
+
+# --------------------------------------------------
+# METRICS
+# --------------------------------------------------
+METRIC_PREFIX = 'docgen_'
+# Histogram upper bounds in seconds
+METRIC_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+METRIC_HELP = {
+    'stage_duration_seconds': ('histogram', 'Time spent in each generation stage'),
+    'request_duration_seconds': ('histogram', 'Time to produce a response, by endpoint'),
+    'documents_generated_total': ('counter', 'Templates filled with case data'),
+    'pdf_conversions_total': ('counter', 'Documents converted to PDF, by engine'),
+    'pdf_conversion_failures_total': ('counter', 'Failed PDF conversions, by engine'),
+    'pdf_fallbacks_total': ('counter', 'Documents handed from one PDF engine to the next'),
+}
+
+# Per-request {stage: seconds} while SERVER_TIMING is on. Executor threads
+# start with an empty context, so only stages run on the request thread count.
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+_NO_SPAN = contextlib.nullcontext()
+
+class _Span:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe('stage_duration_seconds', elapsed, stage=self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+
+class Metrics:
+    """Process-wide histograms and counters, rendered in Prometheus text format.
+
+    When disabled, span() hands back a shared no-op context manager and the
+    other methods return immediately.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum]
+        self.counters = collections.Counter()  # (name, labels) -> value
+
+    def span(self, stage):
+        return _Span(self, stage) if self.enabled else _NO_SPAN
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect.bisect_left(METRIC_BUCKETS, seconds)
+        with self.lock:
+            values = self.histograms.get(key)
+            if values is None:
+                values = self.histograms[key] = [0] * (len(METRIC_BUCKETS) + 1) + [0.0]
+            values[bucket] += 1
+            values[-1] += seconds
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled or not amount:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += amount
+
+    def render(self, extra=()):
+        """Exposition text for everything recorded, plus (name, type, help, value) samples"""
+        with self.lock:
+            histograms = {key: list(values) for key, values in self.histograms.items()}
+            counters = dict(self.counters)
+
+        def label_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            full = METRIC_PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), values in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip((*METRIC_BUCKETS, '+Inf'), values):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{full}_sum{label_text(labels)} {values[-1]:.6f}")
+                    lines.append(f"{full}_count{label_text(labels)} {cumulative}")
+            else:
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{full}{label_text(labels)} {value}")
+        for name, kind, help_text, value in extra:
+            full = METRIC_PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            lines.append(f"{full} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(METRICS_ENABLED)
+
+def count_pdf_results(engine, converted):
+    ok = sum(1 for c in converted if c)
+    metrics.inc('pdf_conversions_total', ok, engine=engine)
+    metrics.inc('pdf_conversion_failures_total', len(converted) - ok, engine=engine)
+
+# --------------------------------------------------
+# CASE SEARCH
+# --------------------------------------------------
+# Saved cases are indexed for repeat-offender lookup: names, addresses and
+# marks go into an SQLite FTS5 trigram index, mobile and ID numbers into an
+# exact-match table (see CaseStore). Names are folded to one Latin spelling
+# first, so "ભાવેશ", "Bhavesh" and "Bhaveshbhai" find each other.
+# Bumped when folding or the indexed fields change; the index is then rebuilt
+CASE_SEARCH_VERSION = 1
+
+# Fields that belong to the person rather than the case; a search hit copies
+# these into the form. Age is left out since it changes between arrests.
+PERSON_FIELDS = [f for f in REQUIRED_FIELDS[:REQUIRED_FIELDS.index("case_ps")] if f != "acc_age"] + list(IMAGE_FIELDS)
+SEARCH_NAME_FIELDS = ["acc_name", "acc_father", "acc_surname", "acc_alias"]
+SEARCH_DETAIL_FIELDS = [
+    "perm_house", "perm_area", "perm_village", "perm_taluka", "perm_district",
+    "curr_address", "curr_city", "curr_taluka", "curr_district",
+    "mark_1", "mark_2", "old_wounds", "other_id_marks", "rel_name",
+]
+
+GUJARATI_CONSONANTS = dict(zip(
+    "કખગઘઙચછજઝઞટઠડઢણતથદધનપફબભમયરલળવશષસહ",
+    ["k", "kh", "g", "gh", "n", "ch", "chh", "j", "jh", "n", "t", "th", "d", "dh", "n",
+     "t", "th", "d", "dh", "n", "p", "ph", "b", "bh", "m", "y", "r", "l", "l", "v",
+     "sh", "sh", "s", "h"]
+))
+GUJARATI_VOWELS = {
+    # Independent vowels
+    "અ": "a", "આ": "aa", "ઇ": "i", "ઈ": "ii", "ઉ": "u", "ઊ": "uu", "ઋ": "ru",
+    "એ": "e", "ઐ": "ai", "ઓ": "o", "ઔ": "au", "ઍ": "e", "ઑ": "o",
+    # Vowel signs
+    "ા": "aa", "િ": "i", "ી": "ii", "ુ": "u", "ૂ": "uu", "ૃ": "ru",
+    "ે": "e", "ૈ": "ai", "ો": "o", "ૌ": "au", "ૅ": "e", "ૉ": "o",
+    # Anusvara, chandrabindu, visarga
+    "ં": "n", "ઁ": "n", "ઃ": "h",
+}
+GUJARATI_DIGITS = str.maketrans("૦૧૨૩૪૫૬૭૮૯", "0123456789")
+# Spelling variants collapsed after transliteration, in order
+NAME_FOLDS = [
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"([bcdgjkpst])h+"), r"\1"),  # aspirates: bh, kh, sh, chh
+    (re.compile(r"w"), "v"),
+    (re.compile(r"z"), "j"),
+    (re.compile(r"q"), "k"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"ee|ii"), "i"),
+    (re.compile(r"oo|uu"), "u"),
+    (re.compile(r"([a-z])\1+"), r"\1"),
+]
+
+def transliterate(text):
+    """Gujarati script to rough Latin; the final and pre-vowel "a" is dropped as it is spoken"""
+    out = []
+    for i, ch in enumerate(text):
+        if ch in GUJARATI_CONSONANTS:
+            out.append(GUJARATI_CONSONANTS[ch])
+            nxt = text[i + 1] if i + 1 < len(text) else ""
+            if nxt and (nxt in GUJARATI_CONSONANTS or nxt in "ંઁઃ"):
+                out.append("a")
+        elif ch in GUJARATI_VOWELS:
+            out.append(GUJARATI_VOWELS[ch])
+        elif ch not in "઼્":  # virama, nukta
+            out.append(ch)
+    return "".join(out).translate(GUJARATI_DIGITS)
+
+def fold_name(text):
+    """Lower-case Latin words with spelling variants collapsed, e.g. "Bhaveshbhai" -> "bavesbai" """
+    text = re.sub(r"[^a-z0-9]+", " ", transliterate(text).lower())
+    for pattern, replacement in NAME_FOLDS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def name_skeleton(word):
+    """A folded word without its inner "a"s, so "kamlesh" and "kamalesh" agree"""
+    return word[:1] + word[1:].replace("a", "")
+
+def search_text(data, fields):
+    """FTS text for a case: the folded words, their skeletons, and the skeletons run together"""
+    folded = fold_name(" ".join(data.get(f, "") for f in fields))
+    skeletons = [name_skeleton(w) for w in folded.split()]
+    return f"{folded} {' '.join(skeletons)} {''.join(skeletons)}"
+
+def mobile_key(value):
+    """Last ten digits of a phone number, or None"""
+    digits = re.sub(r"\D", "", value.translate(GUJARATI_DIGITS))
+    return digits[-10:] if len(digits) >= 6 else None
+
+def id_key(value):
+    """ID number without spaces or punctuation, upper-cased, or None"""
+    return re.sub(r"[^0-9A-Za-z]", "", value.translate(GUJARATI_DIGITS)).upper() or None
+
+def case_keys(data):
+    keys = {('mobile', mobile_key(data.get(f, ""))) for f in ("mobile_1", "mobile_2")}
+    keys.add(('id', id_key(data.get("id_number", ""))))
+    return [(kind, value) for kind, value in keys if value]
+
+# Honorifics written onto names ("Rameshbhai", "Gitaben"), folded
+NAME_SUFFIX_PATTERN = re.compile(r"(bai|ben|kumar)\b")
+
+def person_key(data):
+    """Same key for the same accused across cases: folded name, father and surname without honorifics"""
+    names = fold_name(" ".join(data.get(f, "") for f in ("acc_name", "acc_father", "acc_surname")))
+    return NAME_SUFFIX_PATTERN.sub("", names).replace(" ", "")
+
+def name_similarity(query_words, names):
+    """Mean over folded query words of the best match against any of the case's
+    name words, or their start ("bavas" vs "bavesbai")"""
+    words = fold_name(names).split()
+    if not words:
+        return 0.0
+    def best(q):
+        return max(max(difflib.SequenceMatcher(None, q, w).ratio(),
+                       difflib.SequenceMatcher(None, q, w[:len(q)]).ratio()) for w in words)
+    return sum(best(q) for q in query_words) / len(query_words)
+
 # --------------------------------------------------
 # HELPER FUNCTIONS
 # --------------------------------------------------
+class CaseStore:
+    """Cases kept in SQLite, with an in-memory LRU of recently used ones.
+
+    Each case is a JSON object of REQUIRED_FIELDS values plus a version that
+    increases on every write; cached copies are only used while their version
+    still matches the database, so several worker processes can share a file.
+    The search tables (CASE SEARCH) are written in the same transaction as
+    the case, keyed by its rowid.
+    """
+
+    def __init__(self, path, cache_size):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()  # case_id -> (version, data)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.ready = False
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            return conn
+        with self.lock:
+            if not self.ready:
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    sqlite3.connect(self.path).close()
+                except (OSError, sqlite3.Error):
+                    # Read-only deployments (Vercel) can only write to the temp dir
+                    self.path = os.path.join(tempfile.gettempdir(), os.path.basename(self.path))
+                conn = sqlite3.connect(self.path, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cases ("
+                    " id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL,"
+                    " created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cases_updated ON cases (updated_at)")
+                conn.commit()
+                self._prepare_search(conn)
+                conn.close()
+                self.ready = True
+        conn = self.local.conn = sqlite3.connect(self.path, timeout=10)
+        return conn
+
+    def _prepare_search(self, conn):
+        """Create the search tables, (re)indexing every case when they are missing or outdated"""
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= CASE_SEARCH_VERSION:
+            return
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have done it while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= CASE_SEARCH_VERSION:
+                return
+            conn.execute("DROP TABLE IF EXISTS case_search")
+            conn.execute("DROP TABLE IF EXISTS case_keys")
+            try:
+                conn.execute("CREATE VIRTUAL TABLE case_search USING fts5(names, details, tokenize='trigram')")
+            except sqlite3.OperationalError:
+                # SQLite before 3.34 has no trigram tokenizer: same columns, searched with LIKE
+                app.logger.warning("SQLite has no FTS5 trigram tokenizer; case search will be slow")
+                conn.execute("CREATE TABLE case_search (names TEXT, details TEXT)")
+            conn.execute("CREATE TABLE case_keys (kind TEXT NOT NULL, value TEXT NOT NULL, case_rowid INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX case_keys_lookup ON case_keys (kind, value)")
+            conn.execute("CREATE INDEX case_keys_case ON case_keys (case_rowid)")
+            for rowid, data in conn.execute("SELECT rowid, data FROM cases").fetchall():
+                self._index(conn, rowid, json.loads(data), replace=False)
+            conn.execute(f"PRAGMA user_version = {CASE_SEARCH_VERSION}")
+
+    def _index(self, conn, rowid, data, replace=True):
+        if replace:
+            conn.execute("DELETE FROM case_search WHERE rowid = ?", (rowid,))
+            conn.execute("DELETE FROM case_keys WHERE case_rowid = ?", (rowid,))
+        conn.execute(
+            "INSERT INTO case_search (rowid, names, details) VALUES (?, ?, ?)",
+            (rowid, search_text(data, SEARCH_NAME_FIELDS), search_text(data, SEARCH_DETAIL_FIELDS))
+        )
+        conn.executemany(
+            "INSERT INTO case_keys (kind, value, case_rowid) VALUES (?, ?, ?)",
+            [(kind, value, rowid) for kind, value in case_keys(data)]
+        )
+
+    def _remember(self, case_id, version, data):
+        with self.lock:
+            self.cache[case_id] = (version, data)
+            self.cache.move_to_end(case_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def get_versioned(self, case_id):
+        """Return (version, data) for a case, or (None, None); data is a private copy"""
+        row = self._connect().execute("SELECT version FROM cases WHERE id = ?", (case_id,)).fetchone()
+        if row is None:
+            return None, None
+        cached = self.cache.get(case_id)
+        if cached is None or cached[0] != row[0]:
+            row = self._connect().execute(
+                "SELECT version, data FROM cases WHERE id = ?", (case_id,)
+            ).fetchone()
+            if row is None:
+                return None, None
+            cached = (row[0], json.loads(row[1]))
+        self._remember(case_id, *cached)
+        return cached[0], dict(cached[1])
+
+    def get(self, case_id):
+        return self.get_versioned(case_id)[1]
+
+    def create(self, data=None):
+        case_id = uuid.uuid4().hex
+        now = datetime.now().isoformat(timespec='seconds')
+        data = clean_case_data(data or {})
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO cases (id, data, version, created_at, updated_at) VALUES (?, ?, 1, ?, ?)",
+                (case_id, json.dumps(data, ensure_ascii=False), now, now)
+            )
+            self._index(conn, cursor.lastrowid, data, replace=False)
+        self._remember(case_id, 1, data)
+        return case_id
+
+    def update(self, case_id, fields, replace=False):
+        """Write fields to a case (all of it with replace=True); returns the new data or None"""
+        conn = self._connect()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock before reading, so concurrent patches don't lose fields
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT rowid, version, data FROM cases WHERE id = ?", (case_id,)).fetchone()
+            if row is None:
+                return None
+            rowid, version, old_data = row
+            data = {} if replace else json.loads(old_data)
+            data.update(clean_case_data(fields))
+            version += 1
+            conn.execute(
+                "UPDATE cases SET data = ?, version = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(data, ensure_ascii=False), version,
+                 datetime.now().isoformat(timespec='seconds'), case_id)
+            )
+            self._index(conn, rowid, data)
+        self._remember(case_id, version, data)
+        return dict(data)
+
+    def list(self, limit=50, offset=0):
+        rows = self._connect().execute(
+            "SELECT id, data, version, created_at, updated_at FROM cases"
+            " ORDER BY updated_at DESC LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        cases = []
+        for case_id, data, version, created_at, updated_at in rows:
+            data = json.loads(data)
+            cases.append({
+                "id": case_id, "version": version,
+                "created_at": created_at, "updated_at": updated_at,
+                "acc_name": data.get("acc_name", ""), "crime_no": data.get("crime_no", ""),
+                "offence_section": data.get("offence_section", ""),
+            })
+        return cases
+
+    def _key_matches(self, kind, prefix, limit):
+        """Cases whose mobile / ID key starts with prefix (a full number is an exact lookup)"""
+        return self._connect().execute(
+            "SELECT DISTINCT case_rowid FROM case_keys WHERE kind = ? AND value >= ? AND value < ? LIMIT ?",
+            (kind, prefix, prefix + "~", limit)
+        ).fetchall()
+
+    def _name_matches(self, words, limit):
+        """Newest cases whose names or details contain every word (folded spelling or skeleton)"""
+        conn = self._connect()
+        terms = []
+        for word in words:
+            variants = {word, name_skeleton(word)}
+            terms.append([v for v in variants if len(v) >= 3])
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        try:
+            match = " AND ".join("(" + " OR ".join(f'"{v}"' for v in t) + ")" for t in terms)
+            return conn.execute(
+                "SELECT rowid FROM case_search WHERE case_search MATCH ?"
+                " ORDER BY rowid DESC LIMIT ?", (match, limit)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Plain-table fallback (no FTS5)
+            where = " AND ".join(
+                "(" + " OR ".join("(names || ' ' || details) LIKE ?" for _ in t) + ")" for t in terms
+            )
+            return conn.execute(
+                f"SELECT rowid FROM case_search WHERE {where} ORDER BY rowid DESC LIMIT ?",
+                [f"%{v}%" for t in terms for v in t] + [limit]
+            ).fetchall()
+
+    def _fuzzy_matches(self, words, limit):
+        """Near misses ("Bhavash" for "Bhavesh"): cases sharing any trigram with the query"""
+        variants = set(words) | {name_skeleton(w) for w in words}
+        grams = {w[i:i + 3] for w in variants for i in range(len(w) - 2)}
+        if not grams:
+            return []
+        try:
+            return self._connect().execute(
+                "SELECT rowid FROM case_search WHERE case_search MATCH ?"
+                " ORDER BY bm25(case_search, 10.0, 0.0) LIMIT ?",
+                (" OR ".join(f'"{g}"' for g in sorted(grams)), limit)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def search(self, query, limit=CASE_SEARCH_LIMIT):
+        """Past cases matching a name (any script or spelling), mobile or ID number.
+
+        Cases of the same person (same folded name, father and surname) are
+        grouped into one result: the latest case, with its PERSON_FIELDS and
+        the number of cases found. Exact mobile / ID hits come first.
+        """
+        query = query.strip()
+        hits = []  # (match kind, case rowid), best first
+        digits = re.sub(r"\D", "", query.translate(GUJARATI_DIGITS))
+        if len(digits) >= 6 and re.fullmatch(r"[\d\s+()\-૦-૯]+", query):
+            key = digits[-10:] if len(digits) > 10 else digits
+            hits += [('mobile', r[0]) for r in self._key_matches('mobile', key, limit * 5)]
+        key = id_key(query)
+        if key and len(key) >= 4 and any(c.isdigit() for c in key):
+            hits += [('id', r[0]) for r in self._key_matches('id', key, limit * 5)]
+
+        words = fold_name(query).split()
+        fuzzy = set()
+        if words and not hits:
+            hits += [('name', r[0]) for r in self._name_matches(words, limit * 5)]
+            if len(hits) < limit:
+                fuzzy = {r[0] for r in self._fuzzy_matches(words, limit * 20)} - {h[1] for h in hits}
+                hits += [('similar', rowid) for rowid in fuzzy]
+        if not hits:
+            return []
+
+        rows = {}
+        rowids = list(dict.fromkeys(h[1] for h in hits))
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            rows.update((r[0], r[1:]) for r in self._connect().execute(
+                "SELECT rowid, id, data, updated_at FROM cases WHERE rowid IN (%s)" % ",".join("?" * len(chunk)),
+                chunk
+            ))
+
+        people = {}
+        for match, rowid in hits:
+            if rowid not in rows:
+                continue
+            case_id, data, updated_at = rows[rowid]
+            data = json.loads(data)
+            score = 1.0
+            if match == 'similar':
+                score = name_similarity(words, " ".join(data.get(f, "") for f in SEARCH_NAME_FIELDS))
+                if score < 0.75:
+                    continue
+            person = person_key(data)
+            entry = people.get(person or case_id)
+            if entry is None:
+                entry = people[person or case_id] = {
+                    "match": match, "score": round(score, 2), "case_count": 0, "updated_at": "",
+                }
+            entry["case_count"] += 1
+            if updated_at > entry["updated_at"]:
+                entry.update({
+                    "id": case_id, "updated_at": updated_at,
+                    "crime_no": data.get("crime_no", ""), "offence_section": data.get("offence_section", ""),
+                    "fields": {f: data[f] for f in PERSON_FIELDS if data.get(f)},
+                })
+        order = {'mobile': 0, 'id': 0, 'name': 1, 'similar': 2}
+        results = sorted(people.values(), key=lambda e: (order[e["match"]], -e["score"]))
+        return results[:limit]
+
+case_store = CaseStore(CASE_DB_PATH, CASE_CACHE_SIZE)
+
+def clean_case_data(data):
+    """Keep only known fields, as strings"""
+    return {k: "" if v is None else str(v) for k, v in data.items()
+            if k in REQUIRED_FIELDS or k in IMAGE_FIELDS}
+
 def load_data():
-    if 'case_data' in session:
-        return session['case_data']
+    case_id = session.get('case_id')
+    if case_id:
+        data = case_store.get(case_id)
+        if data is not None:
+            return data
     return {}
 
 @app.before_request
 def sync_session():
-    if 'case_data' not in session:
-        session['case_data'] = {}
+    # Sessions from before the case store carried the whole case in the cookie
+    if 'case_data' in session:
+        save_data(session.pop('case_data'))
 
 def save_data(data):
-    session['case_data'] = data
-    session.modified = True
+    case_id = session.get('case_id')
+    if not case_id or case_store.update(case_id, data, replace=True) is None:
+        session['case_id'] = case_store.create(data)
+
+def patch_data(fields):
+    """Update only the given fields of the current case; returns the full case"""
+    case_id = session.get('case_id')
+    data = case_store.update(case_id, fields) if case_id else None
+    if data is None:
+        session['case_id'] = case_store.create(fields)
+        data = clean_case_data(fields)
+    return data
+
+def case_access_token():
+    """Session marker for an unlocked session; derived from CASE_ACCESS_KEY, so
+    knowing the cookie secret isn't enough to forge it"""
+    return hmac.new(CASE_ACCESS_KEY.encode('utf-8'), b'case-access', hashlib.sha256).hexdigest()
+
+def has_case_access():
+    return bool(CASE_ACCESS_KEY) and hmac.compare_digest(
+        str(session.get('case_access', '')), case_access_token()
+    )
+
+def case_access_required(view):
+    """Cases other than the session's own need the session unlocked with CASE_ACCESS_KEY"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        case_id = kwargs.get('case_id')
+        if (case_id and case_id == session.get('case_id')) or has_case_access():
+            return view(*args, **kwargs)
+        if not CASE_ACCESS_KEY:
+            return {'status': 'error', 'message': 'Past cases are not enabled on this server'}, 403
+        return {'status': 'error', 'message': 'Unlock past cases first'}, 401
+    return wrapper
+
+# One compiled alternation over every known key; "[" and "]" can't appear in a
+# key so matches never overlap and a single left-to-right scan finds them all.
+PLACEHOLDER_PATTERN = re.compile(
+    r"\[(" + "|".join(re.escape(key) for key in PLACEHOLDER_FIELDS) + r")\]"
+)
+# Any bracketed token, used to report placeholders that aren't in PLACEHOLDER_FIELDS
+TOKEN_PATTERN = re.compile(r"\[([^\[\]\n]{1,64})\]")
+# [img:<field>] or [img:<field>:<width>x<height>] (mm)
+IMAGE_PLACEHOLDER_PATTERN = re.compile(
+    r"\[img:(" + "|".join(re.escape(key) for key in IMAGE_FIELDS) + r")(?::(\d+)x(\d+))?\]"
+)
+
+def is_known_token(token):
+    return token in PLACEHOLDER_FIELDS or IMAGE_PLACEHOLDER_PATTERN.fullmatch(f"[{token}]") is not None
+
+def substitute_run_texts(texts, data):
+    """Return {run_index: new_text} for the runs touched by placeholder substitution.
+
+    The joined text is scanned once. A placeholder split across runs gets its
+    value written into the run where it starts, the runs it spans are emptied
+    and the remainder of its last run moves into the start run as well - the
+    same layout the old per-field rescan produced.
+    """
+    full_text = "".join(texts)
+    matches = list(PLACEHOLDER_PATTERN.finditer(full_text))
+    if not matches:
+        return {}
+
+    starts = []
+    pos = 0
+    for text in texts:
+        starts.append(pos)
+        pos += len(text)
+
+    pieces = [[] for _ in texts]
+    touched = set()
+    redirect_run = redirect_dest = None
+
+    def emit(start, end):
+        # Copy full_text[start:end] into the runs it came from, honouring a
+        # pending redirect for the tail of the last cross-run placeholder
+        while start < end:
+            r = bisect.bisect_right(starts, start) - 1
+            stop = min(end, starts[r] + len(texts[r]))
+            pieces[redirect_dest if r == redirect_run else r].append(full_text[start:stop])
+            start = stop
+
+    cursor = 0
+    for match in matches:
+        start, end = match.span()
+        emit(cursor, start)
+        start_run = bisect.bisect_right(starts, start) - 1
+        end_run = bisect.bisect_right(starts, end - 1) - 1
+        dest = redirect_dest if start_run == redirect_run else start_run
+        pieces[dest].append(str(data.get(match.group(1), "")))
+        touched.update(range(start_run, end_run + 1))
+        if end_run != start_run:
+            redirect_run, redirect_dest = end_run, dest
+        cursor = end
+    emit(cursor, len(full_text))
+
+    return {i: "".join(pieces[i]) for i in sorted(touched)}
 
 def replace_text_in_paragraph(paragraph, data):
-    if not paragraph.runs:
+    runs = paragraph.runs
+    if not runs:
         return
 
-    for key in REQUIRED_FIELDS:
-        placeholder = f"[{key}]"
-        while True:
-            full_text = "".join(run.text for run in paragraph.runs)
-            idx = full_text.find(placeholder)
-            if idx == -1:
-                break
+    for i, text in substitute_run_texts([run.text for run in runs], data).items():
+        runs[i].text = text
+
+def fill_run_text(text, data):
+    """Substitute placeholders that lie wholly inside one run's text"""
+    return PLACEHOLDER_PATTERN.sub(lambda m: str(data.get(m.group(1), "")), text)
+
+def iter_story_parts(doc):
+    """The main document part, then every header/footer part once (sections often share them)"""
+    part = doc.part
+    yield part
+    seen = set()
+    for sect_pr in part.element.body.iter(qn('w:sectPr')):
+        for ref in sect_pr.iterchildren(qn('w:headerReference'), qn('w:footerReference')):
+            related = part.related_parts.get(ref.get(qn('r:id')))
+            if related is not None and id(related) not in seen:
+                seen.add(id(related))
+                yield related
+
+def iter_template_paragraphs(doc):
+    """Yield every paragraph placeholders are filled in, in one pass per part.
+
+    Each part's tree is walked once in document order, so paragraphs inside
+    tables (merged or nested), text boxes and content controls are reached
+    alongside body paragraphs; headers and footers follow the body.
+    """
+    for part in iter_story_parts(doc):
+        for p in part.element.iter(qn('w:p')):
+            yield Paragraph(p, part)
 
-            start = idx
-            end = idx + len(placeholder)
-            value = str(data.get(key, ""))
+# --------------------------------------------------
+# IMAGE PLACEHOLDERS
+# --------------------------------------------------
+# Phone photos are several MB; each one is downscaled once per frame size and
+# the result kept on disk under the original's hash and the size, so every
+# template using the same frame embeds byte-identical pictures. python-docx
+# stores identical pictures once per document, and docxcompose reuses the
+# part when templates are merged, so the photo is in a merged file only once.
+IMAGE_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Frame of the thumbnails served to the form and the preview
+THUMBNAIL_FRAME = (40, 40)
+_pillow = None
+_image_dir = None
+
+def pillow_api():
+    """Pillow's Image and ImageOps, imported on first use; None when it isn't installed"""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            app.logger.warning("Pillow is not installed; images are embedded at full size")
+            _pillow = False
+        else:
+            _pillow = types.SimpleNamespace(Image=Image, ImageOps=ImageOps)
+    return _pillow or None
 
-            run_positions = []
+def image_directory():
+    global _image_dir
+    if _image_dir is None:
+        directory = IMAGE_DIR
+        try:
+            os.makedirs(os.path.join(directory, 'resized'), exist_ok=True)
+        except OSError:
+            # Read-only deployments (Vercel) can only write to the temp dir
+            directory = os.path.join(tempfile.gettempdir(), 'police_docs_images')
+            os.makedirs(os.path.join(directory, 'resized'), exist_ok=True)
+        _image_dir = directory
+    return _image_dir
+
+def store_image(content):
+    """Save an uploaded image under its content hash and return that ID; ValueError if it isn't one"""
+    try:
+        DocxImage.from_blob(content)
+    except UnrecognizedImageError:
+        raise ValueError("Not a supported image (JPEG, PNG, GIF, BMP or TIFF)")
+    image_id = hashlib.sha256(content).hexdigest()
+    path = os.path.join(image_directory(), image_id)
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+    return image_id
+
+@functools.lru_cache(maxsize=32)
+def fitted_image(image_id, frame_mm):
+    """(bytes, width mm, height mm) of an uploaded image fitted inside frame_mm, or None.
+
+    With Pillow the picture is turned upright (phone EXIF) and downscaled to
+    IMAGE_DPI for the frame; without it the original is used as it is.
+    """
+    if not IMAGE_ID_PATTERN.fullmatch(image_id or ""):
+        return None
+    path = os.path.join(image_directory(), image_id)
+    if not os.path.exists(path):
+        return None
+    width_px = max(1, round(frame_mm[0] / 25.4 * IMAGE_DPI))
+    height_px = max(1, round(frame_mm[1] / 25.4 * IMAGE_DPI))
+    pil = pillow_api()
+    if pil is None:
+        content = read_file(path)
+    else:
+        resized = os.path.join(image_directory(), 'resized', f"{image_id}_{width_px}x{height_px}")
+        try:
+            content = read_file(resized)
+        except OSError:
+            with pil.Image.open(path) as original:
+                picture = pil.ImageOps.exif_transpose(original)
+                picture.thumbnail((width_px, height_px))
+                output = io.BytesIO()
+                if picture.mode in ('RGBA', 'LA', 'P'):
+                    picture.save(output, 'PNG', optimize=True)
+                else:
+                    picture.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+            content = output.getvalue()
+            with open(resized + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(resized + '.tmp', resized)
+    image = DocxImage.from_blob(content)
+    scale = min(frame_mm[0] / image.px_width, frame_mm[1] / image.px_height)
+    return content, image.px_width * scale, image.px_height * scale
+
+def image_frame(match, paragraph):
+    """Frame (mm) of one [img:...] match, shrunk to the width of the table cell it is in"""
+    field, width, height = match.groups()
+    frame = (int(width), int(height)) if width else IMAGE_FIELDS[field]
+    tc = next(paragraph._p.iterancestors(qn('w:tc')), None)
+    tc_width = tc.find(f"{qn('w:tcPr')}/{qn('w:tcW')}") if tc is not None else None
+    if tc_width is not None and tc_width.get(qn('w:type')) == 'dxa' and tc_width.get(qn('w:w'), '').isdigit():
+        # Less the default cell margins (0.19cm each side)
+        room = int(tc_width.get(qn('w:w'))) / 1440 * 25.4 - 4
+        if 0 < room < frame[0]:
+            frame = (room, frame[1] * room / frame[0])
+    return round(frame[0], 1), round(frame[1], 1)
+
+def fill_image_placeholders(paragraph, data):
+    """Put the case's pictures where a paragraph's [img:...] placeholders are.
+
+    Each placeholder becomes a run of its own holding the picture (nothing
+    when the field is empty), with the text around it kept in copies of the
+    original run so the formatting carries over.
+    """
+    normalize_placeholder_runs(paragraph, IMAGE_PLACEHOLDER_PATTERN)
+    for run in paragraph.runs:
+        matches = list(IMAGE_PLACEHOLDER_PATTERN.finditer(run.text))
+        if not matches:
+            continue
+        text = run.text
+        template = copy.deepcopy(run._r)
+        run.text = text[:matches[0].start()]
+        anchor = run._r
+        for k, match in enumerate(matches):
+            fitted = fitted_image(data.get(match.group(1), ""), image_frame(match, paragraph))
+            if fitted is not None:
+                picture = Run(copy.deepcopy(template), paragraph)
+                picture.text = ""
+                content, width, height = fitted
+                picture.add_picture(io.BytesIO(content), width=Mm(width), height=Mm(height))
+                anchor.addnext(picture._r)
+                anchor = picture._r
+            following = text[match.end():matches[k + 1].start() if k + 1 < len(matches) else len(text)]
+            if following:
+                tail = Run(copy.deepcopy(template), paragraph)
+                tail.text = following
+                anchor.addnext(tail._r)
+                anchor = tail._r
+
+# --------------------------------------------------
+# COMPILED TEMPLATE CACHE
+# --------------------------------------------------
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CompiledTemplate:
+    """A template parsed once, with the positions of its placeholders.
+
+    `document` is shared by every request and must never be modified; render()
+    fills a deep copy of it instead of parsing the .docx again. When
+    `flask precompile` has written an up-to-date optimized copy, that copy and
+    its stored positions are used instead of scanning the original.
+    """
+
+    def __init__(self, path, mtime, use_precompiled=True):
+        self.path = path
+        self.mtime = mtime
+        self.size = os.path.getsize(path)
+        self.sha256 = file_sha256(path)
+        self.placeholders = set()
+        # Placeholders Word split over several runs, and [tokens] we don't know
+        self.split_placeholders = set()
+        self.unknown_tokens = set()
+        # (index into iter_template_paragraphs(), indexes of the runs holding
+        # placeholders) - run indexes are None when a placeholder spans runs
+        self.locations = []
+        # [img:...] fields, and the indexes of the paragraphs holding them
+        self.image_placeholders = set()
+        self.image_locations = []
+
+        entry = precompiled_entry(path, self.sha256) if use_precompiled else None
+        if entry is not None:
+            self.document = Document(entry['path'])
+            self.placeholders.update(entry['placeholders'])
+            self.split_placeholders.update(entry['split_placeholders'])
+            self.unknown_tokens.update(entry['unknown_tokens'])
+            self.locations = [(i, runs) for i, runs in entry['locations']]
+            self.image_placeholders.update(entry['image_placeholders'])
+            self.image_locations = entry['image_locations']
+        else:
+            self.document = Document(path)
+            self.scan()
+
+    def scan(self):
+        for i, p in enumerate(iter_template_paragraphs(self.document)):
+            # Only text in the paragraph's own runs gets substituted, so only
+            # that counts (not hyperlink or field result text)
+            run_texts = [run.text for run in p.runs]
+            run_text = "".join(run_texts)
+            self.placeholders.update(PLACEHOLDER_PATTERN.findall(run_text))
+            self.unknown_tokens.update(
+                token for token in TOKEN_PATTERN.findall(run_text) if not is_known_token(token)
+            )
+            images = [m.group(1) for m in IMAGE_PLACEHOLDER_PATTERN.finditer(run_text)]
+            if images:
+                self.image_placeholders.update(images)
+                self.image_locations.append(i)
+
+            run_ends = []
             pos = 0
-            for i, run in enumerate(paragraph.runs):
-                run_positions.append((i, pos, pos + len(run.text)))
-                pos += len(run.text)
-
-            start_run_idx = None
-            end_run_idx = None
-            start_offset = 0
-            end_offset = 0
-            for i, s, e in run_positions:
-                if start_run_idx is None and start >= s and start < e:
-                    start_run_idx = i
-                    start_offset = start - s
-                if end_run_idx is None and end > s and end <= e:
-                    end_run_idx = i
-                    end_offset = end - s
-                if start_run_idx is not None and end_run_idx is not None:
-                    break
-
-            if start_run_idx is None or end_run_idx is None:
-                break
+            for text in run_texts:
+                pos += len(text)
+                run_ends.append(pos)
+            run_indexes = set()
+            split = False
+            for match in PLACEHOLDER_PATTERN.finditer(run_text):
+                start_run = bisect.bisect_right(run_ends, match.start())
+                end_run = bisect.bisect_right(run_ends, match.end() - 1)
+                if start_run != end_run:
+                    self.split_placeholders.add(match.group(1))
+                    split = True
+                run_indexes.add(start_run)
+            if run_indexes:
+                self.locations.append((i, None if split else sorted(run_indexes)))
+
+    def render(self, data):
+        data = placeholder_values(self, data)
+        # lxml elements ignore the deepcopy memo, so the copied Document wrapper
+        # holds a different tree from the copied part that gets saved; rebuild
+        # the wrapper from the part to work on the tree that is actually written
+        with metrics.span('substitute'):
+            doc = copy.deepcopy(self.document).part.document
+            if self.locations or self.image_locations:
+                paragraphs = list(iter_template_paragraphs(doc))
+                for i, run_indexes in self.locations:
+                    if run_indexes is None:
+                        replace_text_in_paragraph(paragraphs[i], data)
+                        continue
+                    # Fast path: every placeholder sits inside a single run
+                    runs = paragraphs[i].runs
+                    for r in run_indexes:
+                        runs[r].text = fill_run_text(runs[r].text, data)
+                for i in self.image_locations:
+                    fill_image_placeholders(paragraphs[i], data)
+        metrics.inc('documents_generated_total')
+        return doc
+
+def placeholder_values(compiled, data):
+    """Values of just the placeholders a template uses, derived fields included"""
+    return {key: field_value(data, key) for key in compiled.placeholders | compiled.image_placeholders}
+
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+def load_compiled_template(template_path):
+    """Return the CompiledTemplate for a path, recompiling it when the file's mtime or size changes"""
+    key = os.path.abspath(template_path)
+    try:
+        stat = os.stat(key)
+    except OSError:
+        with _template_cache_lock:
+            _template_cache.pop(key, None)
+        return None
+    mtime = stat.st_mtime_ns
+
+    compiled = _template_cache.get(key)
+    if compiled is not None and compiled.mtime == mtime and compiled.size == stat.st_size:
+        return compiled
+
+    with metrics.span('template_load'):
+        compiled = CompiledTemplate(key, mtime)
+    with _template_cache_lock:
+        _template_cache[key] = compiled
+    update_placeholder_index(compiled)
+    return compiled
 
-            if start_run_idx == end_run_idx:
-                run = paragraph.runs[start_run_idx]
-                run.text = run.text[:start_offset] + value + run.text[end_offset:]
+# --------------------------------------------------
+# PLACEHOLDER MANIFEST
+# --------------------------------------------------
+# {"<section>/<file>.docx": {"mtime_ns", "size", "sha256", "placeholders",
+#  "split_placeholders", "unknown_tokens"}} for every template on disk. Request
+# handlers only read this dict; it is replaced wholesale, never mutated.
+_placeholder_index = {}
+
+def scan_version(fmt):
+    """A file format number plus a hash of the known placeholder names.
+
+    What a template scan finds depends on both, so stored scan results are
+    only trusted when this matches.
+    """
+    names = json.dumps([sorted(PLACEHOLDER_FIELDS), sorted(IMAGE_FIELDS)])
+    return f"{fmt}-{hashlib.sha256(names.encode('utf-8')).hexdigest()[:12]}"
+
+def template_index_key(template_path):
+    rel = os.path.relpath(os.path.abspath(template_path), os.path.abspath(TEMPLATE_DIR))
+    return rel.replace(os.sep, '/')
+
+def build_index_entry(compiled):
+    stat = os.stat(compiled.path)
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": compiled.sha256,
+        "placeholders": sorted(compiled.placeholders),
+        "image_placeholders": sorted(compiled.image_placeholders),
+        "split_placeholders": sorted(compiled.split_placeholders),
+        "unknown_tokens": sorted(compiled.unknown_tokens),
+    }
+
+def update_placeholder_index(compiled):
+    global _placeholder_index
+    key = template_index_key(compiled.path)
+    if key.startswith('..'):
+        return
+    try:
+        entry = build_index_entry(compiled)
+    except OSError:
+        return
+    index = dict(_placeholder_index)
+    index[key] = entry
+    _placeholder_index = index
+
+def iter_template_files():
+    """Every .docx under TEMPLATE_DIR, skipping Word's ~$ lock files"""
+    for root, _dirs, files in os.walk(TEMPLATE_DIR):
+        for name in sorted(files):
+            if name.endswith('.docx') and not name.startswith('~$'):
+                yield os.path.join(root, name)
+
+def load_placeholder_index():
+    try:
+        with open(PLACEHOLDER_INDEX_FILE, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Entries written by an older scanner, or for other fields, are rebuilt rather than trusted
+    if data.get('format', 1) != PLACEHOLDER_INDEX_FORMAT or data.get('version') != scan_version(PLACEHOLDER_INDEX_FORMAT):
+        return {}
+    return data.get('templates', {})
+
+def refresh_placeholder_index(write=True):
+    """Bring the manifest in line with TEMPLATE_DIR, re-scanning only changed files.
+
+    A template whose mtime moved but whose content hash didn't (e.g. after a git
+    checkout) keeps its entry. Returns the new index.
+    """
+    global _placeholder_index
+    previous = _placeholder_index or load_placeholder_index()
+    index = {}
+    for path in iter_template_files():
+        key = template_index_key(path)
+        stat = os.stat(path)
+        entry = previous.get(key)
+        if entry and entry['size'] == stat.st_size:
+            if entry['mtime_ns'] == stat.st_mtime_ns:
+                index[key] = entry
+                continue
+            if entry['sha256'] == file_sha256(path):
+                index[key] = dict(entry, mtime_ns=stat.st_mtime_ns)
+                continue
+        index[key] = build_index_entry(CompiledTemplate(os.path.abspath(path), stat.st_mtime_ns))
+
+    _placeholder_index = index
+    if write and index != load_placeholder_index():
+        try:
+            with open(PLACEHOLDER_INDEX_FILE, 'w', encoding='utf-8') as f:
+                json.dump({"format": PLACEHOLDER_INDEX_FORMAT, "version": scan_version(PLACEHOLDER_INDEX_FORMAT),
+                           "templates": index}, f,
+                          indent=2, ensure_ascii=False, sort_keys=True)
+                f.write('\n')
+        except OSError:
+            # Read-only deployments (Vercel) keep the refreshed index in memory
+            pass
+    return index
+
+def template_placeholders(filename, section=None):
+    """Placeholders used by a template, from the manifest (one stat, no parsing).
+
+    Templates added or edited since the manifest was built are compiled on the
+    spot, which also brings their manifest entry up to date.
+    """
+    path = get_template_path(filename, section)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return set()
+    entry = _placeholder_index.get(template_index_key(path))
+    if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+        compiled = load_compiled_template(path)
+        return set(compiled.placeholders) if compiled else set()
+    return set(entry['placeholders'])
+
+# --------------------------------------------------
+# TEMPLATE PRECOMPILATION
+# --------------------------------------------------
+# `flask precompile` writes PRECOMPILED_DIR/<section>/<file>.docx with every
+# split placeholder merged into one run, and PRECOMPILED_INDEX_NAME recording
+# each copy's source hash, compiler version and placeholder positions. Bump
+# PRECOMPILE_FORMAT whenever the meaning of a position changes; together with
+# the known placeholder names it makes up the version each entry is checked
+# against, so copies built by another compiler are ignored.
+PRECOMPILED_INDEX_NAME = 'positions.json'
+PRECOMPILE_FORMAT = 4
+# Run children that are just text; runs holding anything else are never merged
+PLAIN_RUN_TAGS = {qn('w:rPr'), qn('w:t'), qn('w:tab'), qn('w:br'), qn('w:cr')}
+
+_precompiled_index = (None, {})
+
+def load_precompiled_index():
+    """PRECOMPILED_DIR's positions index, re-read when the file changes"""
+    global _precompiled_index
+    path = os.path.join(PRECOMPILED_DIR, PRECOMPILED_INDEX_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    if _precompiled_index[0] != mtime:
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        templates = data.get('templates', {}) if data.get('format') == PRECOMPILE_FORMAT else {}
+        _precompiled_index = (mtime, templates)
+    return _precompiled_index[1]
+
+def precompiled_entry(template_path, sha256):
+    """Index entry (plus 'path') of an optimized copy built from exactly this template, else None"""
+    key = template_index_key(template_path)
+    entry = load_precompiled_index().get(key)
+    if entry is None or entry['source_sha256'] != sha256 or entry.get('compiler') != scan_version(PRECOMPILE_FORMAT):
+        return None
+    path = os.path.join(PRECOMPILED_DIR, key)
+    if not os.path.exists(path):
+        return None
+    return dict(entry, path=path)
+
+def normalize_placeholder_runs(paragraph, pattern=PLACEHOLDER_PATTERN):
+    """Move every placeholder (match of pattern) split across runs into the run where it starts.
+
+    The placeholder takes that run's formatting; runs left empty are removed.
+    Returns how many placeholders were joined into one run, or None when a
+    spanned run holds more than text (a field, a drawing) and the paragraph
+    was left alone.
+    """
+    runs = paragraph.runs
+    texts = [run.text for run in runs]
+    owners = [i for i, text in enumerate(texts) for _ in text]
+    full_text = "".join(texts)
+
+    spans = []
+    for match in pattern.finditer(full_text):
+        start, end = match.span()
+        if owners[start] != owners[end - 1]:
+            spans.append((start, end))
+    if not spans:
+        return 0
+    for start, end in spans:
+        for i in range(owners[start], owners[end - 1] + 1):
+            if any(child.tag not in PLAIN_RUN_TAGS for child in runs[i]._r):
+                return None
+
+    for start, end in spans:
+        owners[start:end] = [owners[start]] * (end - start)
+    pieces = [[] for _ in texts]
+    for char, owner in zip(full_text, owners):
+        pieces[owner].append(char)
+
+    for run, old_text, piece in zip(runs, texts, pieces):
+        new_text = "".join(piece)
+        if new_text == old_text:
+            continue
+        if new_text:
+            run.text = new_text
+        else:
+            run._r.getparent().remove(run._r)
+    return len(spans)
+
+def lint_placeholder_text(text):
+    """Problems with the [tokens] in one paragraph's text, as readable messages"""
+    problems = []
+    for token in TOKEN_PATTERN.findall(text):
+        if is_known_token(token):
+            continue
+        guess = difflib.get_close_matches(token.strip(), PLACEHOLDER_FIELDS, n=1, cutoff=0.8)
+        problems.append(f"unknown token [{token}]" + (f", did you mean [{guess[0]}]?" if guess else ""))
+    # Brackets left over once every well-formed token is gone are unbalanced
+    leftover = TOKEN_PATTERN.sub("", text)
+    for match in re.finditer(r"[\[\]]", leftover):
+        snippet = leftover[max(0, match.start() - 15):match.start() + 15].strip()
+        problems.append(f"unbalanced '{match.group()}' in \"{snippet}\"")
+    return problems
+
+def precompile_template(source_path, target_path):
+    """Write an optimized copy of one template; returns (index entry, problems, placeholders joined)"""
+    source = CompiledTemplate(source_path, os.stat(source_path).st_mtime_ns, use_precompiled=False)
+    doc = Document(source_path)
+    problems = []
+    joined = 0
+    for i, p in enumerate(iter_template_paragraphs(doc)):
+        problems.extend(f"paragraph {i}: {problem}" for problem in lint_placeholder_text(p.text))
+        for pattern in (PLACEHOLDER_PATTERN, IMAGE_PLACEHOLDER_PATTERN):
+            count = normalize_placeholder_runs(p, pattern)
+            if count is None:
+                problems.append(f"paragraph {i}: placeholder spans a field or drawing, left split")
             else:
-                start_run = paragraph.runs[start_run_idx]
-                end_run = paragraph.runs[end_run_idx]
-                start_text = start_run.text
-                end_text = end_run.text
-                start_run.text = start_text[:start_offset] + value + end_text[end_offset:]
-                for i in range(start_run_idx + 1, end_run_idx + 1):
-                    paragraph.runs[i].text = ""
+                joined += count
+
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    doc.save(target_path)
+    optimized = CompiledTemplate(target_path, os.stat(target_path).st_mtime_ns, use_precompiled=False)
+    entry = {
+        "source_sha256": source.sha256,
+        "compiler": scan_version(PRECOMPILE_FORMAT),
+        "placeholders": sorted(optimized.placeholders),
+        "split_placeholders": sorted(source.split_placeholders),
+        "unknown_tokens": sorted(optimized.unknown_tokens),
+        "locations": [[i, runs] for i, runs in optimized.locations],
+        "image_placeholders": sorted(optimized.image_placeholders),
+        "image_locations": optimized.image_locations,
+    }
+    return entry, problems, joined
+
+def precompiled_stale():
+    """True when some template has no precompiled copy built from its current content"""
+    for path in iter_template_files():
+        if precompiled_entry(path, file_sha256(path)) is None:
+            return True
+    return False
+
+def precompile_templates(check=False, report=print):
+    """Lint every template and, unless check, swap in a freshly built PRECOMPILED_DIR.
 
+    Returns the number of problems found.
+    """
+    build_dir = tempfile.mkdtemp(prefix='precompile-', dir=os.path.dirname(os.path.abspath(PRECOMPILED_DIR)))
+    index = {}
+    problem_count = 0
+    try:
+        for path in iter_template_files():
+            key = template_index_key(path)
+            entry, problems, joined = precompile_template(path, os.path.join(build_dir, key))
+            index[key] = entry
+            problem_count += len(problems)
+            slow = sum(1 for _i, runs in entry['locations'] if runs is None)
+            report(f"{key}: {len(entry['placeholders'])} placeholders, {joined} split placeholders joined"
+                   + (f", {slow} paragraphs still split" if slow else ""))
+            for problem in problems:
+                report(f"  {problem}")
+
+        if not check:
+            with open(os.path.join(build_dir, PRECOMPILED_INDEX_NAME), 'w', encoding='utf-8') as f:
+                json.dump({"format": PRECOMPILE_FORMAT, "templates": index}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            # Swap the whole directory so a running server never sees half of it
+            previous = PRECOMPILED_DIR + '.old'
+            shutil.rmtree(previous, ignore_errors=True)
+            if os.path.exists(PRECOMPILED_DIR):
+                os.rename(PRECOMPILED_DIR, previous)
+            os.rename(build_dir, PRECOMPILED_DIR)
+            shutil.rmtree(previous, ignore_errors=True)
+            report(f"Wrote {len(index)} templates to {PRECOMPILED_DIR}")
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return problem_count
+
+# --------------------------------------------------
+# DOCUMENT GENERATION
+# --------------------------------------------------
 def generate_document(template_name, data, output_path, section=None):
     template_path = get_template_path(template_name, section)
-    if not os.path.exists(template_path):
+    compiled = load_compiled_template(template_path)
+    if compiled is None:
         return False
-    
-    doc = Document(template_path)
-    
-    # Replace in paragraphs
-    for p in doc.paragraphs:
-        replace_text_in_paragraph(p, data)
-        
-    # Replace in tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    replace_text_in_paragraph(p, data)
-                    
-    doc.save(output_path)
+
+    doc = compiled.render(data)
+    with metrics.span('save'):
+        doc.save(output_path)
     return True
 
-def generate_pdf_from_docx(docx_path, pdf_path):
-    try:
-        convert(docx_path, pdf_path)
-        if os.path.exists(pdf_path):
-            return True
-    except Exception:
-        pass
+def render_filled_document(template_name, data, section=None):
+    """Fill a template and return the in-memory Document; raises FileNotFoundError if it is missing"""
+    compiled = load_compiled_template(get_template_path(template_name, section))
+    if compiled is None:
+        raise FileNotFoundError("Template not found")
+    return compiled.render(data)
 
+def extract_placeholders_from_docx(template_path):
+    compiled = load_compiled_template(template_path)
+    if compiled is None:
+        return set()
+    return set(compiled.placeholders)
+
+# --------------------------------------------------
+# HTML PREVIEW
+# --------------------------------------------------
+PREVIEW_STYLE = """<style>
+    .docx-preview-para { margin: 0.5em 0; line-height: 1.4; }
+    .docx-preview-table { width: 100%; margin: 0.5em 0; border-collapse: collapse; border: 1px solid #999; }
+    .docx-preview-table td { border: 1px solid #999; padding: 8px; vertical-align: top; }
+    .docx-preview-table th { border: 1px solid #999; padding: 8px; background-color: #e9ecef; font-weight: bold; }
+    .docx-preview-run { display: inline; }
+    </style>"""
+
+PARAGRAPH_ALIGN_CSS = {
+    WD_ALIGN_PARAGRAPH.CENTER: "text-align: center; ",
+    WD_ALIGN_PARAGRAPH.RIGHT: "text-align: right; ",
+    WD_ALIGN_PARAGRAPH.JUSTIFY: "text-align: justify; ",
+}
+
+def _preview_images(text, values):
+    """Swap (escaped) [img:...] placeholders for the uploaded picture, or an empty frame"""
+    def image(match):
+        field, width, height = match.groups()
+        width, height = (width, height) if width else IMAGE_FIELDS[field]
+        box = f"max-width: {width}mm; max-height: {height}mm; vertical-align: top;"
+        if IMAGE_ID_PATTERN.fullmatch(values.get(field, "")):
+            return f"<img src='/api/images/{values[field]}' style='{box}'>"
+        return f"<span style='display: inline-block; width: {width}mm; height: {height}mm; border: 1px dashed #999;'></span>"
+    return IMAGE_PLACEHOLDER_PATTERN.sub(image, text)
+
+def _filled_runs(p, values):
+    """The paragraph's runs and their text after substitution, without touching the tree"""
+    runs = p.r_lst
+    texts = [r.text for r in runs]
+    for i, text in substitute_run_texts(texts, values).items():
+        texts[i] = text
+    return runs, texts
+
+def _preview_paragraph(p, values, out):
+    runs, texts = _filled_runs(p, values)
+    if not "".join(texts).strip():
+        # Add empty paragraph for spacing
+        out.append("<p class='docx-preview-para' style='height: 0.5em;'></p>")
+        return
+
+    fmt = ParagraphFormat(p)
+    out.append("<p class='docx-preview-para' style='")
+    out.append(PARAGRAPH_ALIGN_CSS.get(fmt.alignment, ""))
+    for length, css in ((fmt.left_indent, "margin-left"), (fmt.right_indent, "margin-right"),
+                        (fmt.space_before, "margin-top"), (fmt.space_after, "margin-bottom")):
+        if length:
+            out.append(f"{css}: {length.pt}pt; ")
+    out.append("'>")
+
+    for r, text in zip(runs, texts):
+        font = Font(r)
+        out.append("<span class='docx-preview-run' style='")
+        if font.size:
+            out.append(f"font-size: {font.size.pt}pt; ")
+        if font.bold:
+            out.append("font-weight: bold; ")
+        if font.italic:
+            out.append("font-style: italic; ")
+        if font.underline:
+            out.append("text-decoration: underline; ")
+        if font.color and font.color.rgb:
+            out.append(f"color: #{font.color.rgb}; ")
+        out.append("'>")
+        out.append(_preview_images(html.escape(text), values))
+        out.append("</span>")
+    out.append("</p>")
+
+def _preview_cell_paragraph(p, values, out):
+    runs, texts = _filled_runs(p, values)
+    alignment = ParagraphFormat(p).alignment
+    out.append("<div style='")
+    if alignment in (WD_ALIGN_PARAGRAPH.CENTER, WD_ALIGN_PARAGRAPH.RIGHT):
+        out.append(PARAGRAPH_ALIGN_CSS[alignment])
+    out.append("'>")
+    for r, text in zip(runs, texts):
+        font = Font(r)
+        text = _preview_images(html.escape(text), values)
+        if font.bold:
+            text = f"<b>{text}</b>"
+        if font.italic:
+            text = f"<i>{text}</i>"
+        out.append(text)
+    out.append("</div>")
+
+def _preview_table(tbl, values, out):
+    out.append("<table class='docx-preview-table'>")
+    for row_idx, tr in enumerate(tbl.tr_lst):
+        out.append("<tr>")
+        # First row is rendered as the header
+        tag = "th" if row_idx == 0 else "td"
+        for tc in tr.tc_lst:
+            span = f" colspan='{tc.grid_span}'" if tc.grid_span > 1 else ""
+            out.append(f"<{tag}{span}>")
+            # Cells continuing a vertical merge show their content only once
+            if tc.vMerge != ST_Merge.CONTINUE:
+                for child in tc.iterchildren(qn('w:p'), qn('w:tbl')):
+                    if child.tag == qn('w:p'):
+                        _preview_cell_paragraph(child, values, out)
+                    else:
+                        _preview_table(child, values, out)
+            out.append(f"</{tag}>")
+        out.append("</tr>")
+    out.append("</table>")
+
+def _preview_blocks(parent, values, out):
+    """Render body-level paragraphs and tables in document order"""
+    for child in parent.iterchildren(qn('w:p'), qn('w:tbl'), qn('w:sdt')):
+        if child.tag == qn('w:p'):
+            _preview_paragraph(child, values, out)
+        elif child.tag == qn('w:tbl'):
+            _preview_table(child, values, out)
+        else:
+            content = child.find(qn('w:sdtContent'))
+            if content is not None:
+                _preview_blocks(content, values, out)
+
+def render_preview_html(compiled, data):
+    values = placeholder_values(compiled, data)
+    out = [PREVIEW_STYLE]
+    with metrics.span('preview'):
+        _preview_blocks(compiled.document.element.body, values, out)
+    return "".join(out)
+
+def extract_preview_from_docx(template_path, data):
+    compiled = load_compiled_template(template_path)
+    if compiled is None:
+        return ""
+
+    cache_key = template_cache_key(compiled, data, 'preview')
+    cached = output_cache.get(cache_key)
+    if cached is not None:
+        return cached.decode('utf-8')
+
+    preview_html = render_preview_html(compiled, data)
+    output_cache.put(cache_key, preview_html.encode('utf-8'))
+    return preview_html
+
+# --------------------------------------------------
+# PDF CONVERSION
+# --------------------------------------------------
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self.timeout
+        return conn
+
+class PdfWorker:
+    """One long-lived headless LibreOffice behind a unoserver XML-RPC listener"""
+
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.process = None
+        self.profile_dir = None
+
+    def start(self):
+        self.stop()
+        # Each office instance needs its own profile or they hand work to each other
+        self.profile_dir = tempfile.mkdtemp(prefix=f'lo_worker_{self.index}_')
+        self.process = subprocess.Popen(
+            ["unoserver", "--interface", "127.0.0.1", "--port", str(self.port),
+             "--uno-port", str(self.port + 1000),
+             "--user-installation", f"file://{self.profile_dir}"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + PDF_WORKER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.healthy():
+                return
+            # Exited already, e.g. the port is taken; no point waiting it out
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"PDF worker on port {self.port} did not start")
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+            self.process = None
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+    def healthy(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def convert(self, docx_paths, pdf_paths):
+        proxy = xmlrpc.client.ServerProxy(
+            f"http://127.0.0.1:{self.port}",
+            transport=_TimeoutTransport(PDF_CONVERT_TIMEOUT),
+            allow_none=True
+        )
+        for docx_path, pdf_path in zip(docx_paths, pdf_paths):
+            proxy.convert(os.path.abspath(docx_path), None, os.path.abspath(pdf_path),
+                          "pdf", None, [], False, None)
+
+class PdfWorkerPool:
+    """Fixed set of PdfWorkers fed from a bounded job queue.
+
+    Each worker thread owns one office process: it is started on first use,
+    health-checked while idle and restarted after a crash or failed job.
+    """
+
+    def __init__(self, size, base_port, queue_size):
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.workers = [PdfWorker(i, base_port + i) for i in range(size)]
+        self.threads = []
+        for worker in self.workers:
+            thread = threading.Thread(target=self._run, args=(worker,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self, worker):
+        while True:
+            try:
+                job = self.jobs.get(timeout=PDF_HEALTH_INTERVAL)
+            except queue.Empty:
+                if worker.process is not None and not worker.healthy():
+                    worker.stop()
+                continue
+            if job is None:
+                worker.stop()
+                return
+
+            future, docx_paths, pdf_paths = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if not worker.healthy():
+                    worker.start()
+                with metrics.span('pdf_unoserver'):
+                    worker.convert(docx_paths, pdf_paths)
+                converted = [os.path.exists(p) for p in pdf_paths]
+                count_pdf_results('unoserver', converted)
+                future.set_result(converted)
+            except Exception as e:
+                count_pdf_results('unoserver', [False] * len(pdf_paths))
+                worker.stop()
+                future.set_exception(e)
+
+    def submit(self, docx_paths, pdf_paths):
+        """Queue one conversion round trip; raises queue.Full when the backlog is full"""
+        future = concurrent.futures.Future()
+        self.jobs.put((future, list(docx_paths), list(pdf_paths)), timeout=PDF_QUEUE_TIMEOUT)
+        return future
+
+    def convert_many(self, pairs):
+        """Convert [(docx_path, pdf_path)] spread across the workers, one job per worker.
+
+        Chunks that don't fit in the queue come back False without being queued,
+        and a chunk is only reported False once no worker can still write its
+        PDFs, so the caller's fallback never writes a PDF a worker is also writing.
+        """
+        chunks = [pairs[i::len(self.workers)] for i in range(len(self.workers))]
+        futures = []
+        full = False
+        for chunk in chunks:
+            if not chunk:
+                continue
+            future = None
+            if not full:
+                try:
+                    future = self.submit([d for d, _ in chunk], [p for _, p in chunk])
+                except queue.Full:
+                    full = True
+            futures.append((chunk, future))
+        results = {}
+        for chunk, future in futures:
+            converted = [False] * len(chunk)
+            if future is not None:
+                try:
+                    converted = future.result(timeout=PDF_CONVERT_TIMEOUT * len(chunk))
+                except concurrent.futures.TimeoutError:
+                    # Still queued: drop it before falling back. Already running:
+                    # each of its RPC calls times out on its own, so wait for it
+                    # rather than let the fallback write the same files
+                    if not future.cancel():
+                        try:
+                            converted = future.result()
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
+            for (docx_path, _pdf_path), ok in zip(chunk, converted):
+                results[docx_path] = ok
+        return [results[d] for d, _ in pairs]
+
+    def shutdown(self):
+        for _thread in self.threads:
+            self.jobs.put(None)
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_pool():
+    """The process-wide PdfWorkerPool, or None when unoserver isn't installed"""
+    global _pdf_pool
+    if _pdf_pool is None and PDF_WORKERS > 0 and shutil.which("unoserver"):
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                _pdf_pool = PdfWorkerPool(PDF_WORKERS, PDF_WORKER_BASE_PORT, PDF_QUEUE_SIZE)
+                atexit.register(_pdf_pool.shutdown)
+    return _pdf_pool
+
+def soffice_convert(docx_paths, out_dir):
+    """Cold-start one soffice process that converts every file into out_dir"""
     try:
-        out_dir = os.path.dirname(pdf_path)
         subprocess.run(
-            ["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, docx_path],
+            ["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, *docx_paths],
             check=True,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stderr=subprocess.PIPE,
+            timeout=PDF_CONVERT_TIMEOUT * len(docx_paths)
         )
-        return os.path.exists(pdf_path)
     except Exception:
-        return False
+        pass
 
-def extract_placeholders_from_docx(template_path):
-    if not os.path.exists(template_path):
-        return set()
+def generate_pdfs_from_docx(pairs):
+    """Convert [(docx_path, pdf_path)] in as few round trips as possible; returns a list of bools"""
+    if not pairs:
+        return []
+
+    results = [False] * len(pairs)
+    # Engine that last failed each document, for the fallback counters
+    tried = [None] * len(pairs)
+    pool = get_pdf_pool()
+    if pool is not None:
+        tried = ['unoserver'] * len(pairs)
+        results = pool.convert_many(pairs)
+
+    # docx2pdf drives Microsoft Word, so it is only worth trying where Word can exist
+    if sys.platform in ('win32', 'darwin'):
+        for i, (docx_path, pdf_path) in enumerate(pairs):
+            if results[i]:
+                continue
+            if tried[i]:
+                metrics.inc('pdf_fallbacks_total', **{'from': tried[i], 'to': 'docx2pdf'})
+            tried[i] = 'docx2pdf'
+            try:
+                # Imported here: it is only usable on these platforms and slow to load
+                from docx2pdf import convert
+                with metrics.span('pdf_docx2pdf'):
+                    convert(docx_path, pdf_path)
+                results[i] = os.path.exists(pdf_path)
+            except Exception:
+                pass
+            count_pdf_results('docx2pdf', [results[i]])
+
+    # Whatever is left goes through a single soffice run per output directory
+    pending = {}
+    for i, (docx_path, pdf_path) in enumerate(pairs):
+        if not results[i]:
+            pending.setdefault(os.path.dirname(pdf_path), []).append(i)
+            if tried[i]:
+                metrics.inc('pdf_fallbacks_total', **{'from': tried[i], 'to': 'soffice'})
+    for out_dir, indexes in pending.items():
+        with metrics.span('pdf_soffice'):
+            soffice_convert([pairs[i][0] for i in indexes], out_dir)
+        for i in indexes:
+            results[i] = os.path.exists(pairs[i][1])
+        count_pdf_results('soffice', [results[i] for i in indexes])
+    return results
 
-    doc = Document(template_path)
-    found = set()
+def generate_pdf_from_docx(docx_path, pdf_path):
+    return generate_pdfs_from_docx([(docx_path, pdf_path)])[0]
 
-    def scan_text(text):
-        for key in REQUIRED_FIELDS:
-            placeholder = f"[{key}]"
-            if placeholder in text:
-                found.add(key)
+# --------------------------------------------------
+# DIRECT PDF RENDERING
+# --------------------------------------------------
+_reportlab = None
+_pdf_font = None
+# (regular, bold) font files the direct engine registered
+_pdf_font_files = None
+_pdf_font_lock = threading.Lock()
+
+def reportlab_api():
+    """The ReportLab pieces used below, imported on first use (optional, and slow
+    to import); None when it isn't installed (pip install reportlab uharfbuzz)"""
+    global _reportlab
+    if _reportlab is None:
+        try:
+            from reportlab import platypus
+            from reportlab.lib import colors, enums
+            from reportlab.lib.styles import ParagraphStyle
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+        except ImportError:
+            _reportlab = False
+        else:
+            _reportlab = types.SimpleNamespace(
+                platypus=platypus, colors=colors, enums=enums, ParagraphStyle=ParagraphStyle,
+                pdfmetrics=pdfmetrics, TTFont=TTFont,
+            )
+    return _reportlab or None
+
+def direct_pdf_font():
+    """Register the Gujarati font with ReportLab once; None when the engine can't run"""
+    global _pdf_font, _pdf_font_files
+    if _pdf_font is None:
+        with _pdf_font_lock:
+            if _pdf_font is None:
+                rl = reportlab_api()
+                regular = next((p for p in PDF_FONT_CANDIDATES if p and os.path.exists(p)), None)
+                if rl is None or regular is None:
+                    # Logged once; "direct" templates go through office conversion
+                    app.logger.warning("Direct PDF engine unavailable (%s); using office conversion",
+                                       "pip install reportlab uharfbuzz" if rl is None
+                                       else "no Gujarati font, see PDF_FONT_PATH")
+                    _pdf_font = ''
+                    return None
+                bold = next((p for p in PDF_BOLD_FONT_CANDIDATES if p and os.path.exists(p)), regular)
+                rl.pdfmetrics.registerFont(rl.TTFont('DocGujarati', regular))
+                rl.pdfmetrics.registerFont(rl.TTFont('DocGujarati-Bold', bold))
+                rl.pdfmetrics.registerFontFamily('DocGujarati', normal='DocGujarati', bold='DocGujarati-Bold',
+                                                 italic='DocGujarati', boldItalic='DocGujarati-Bold')
+                _pdf_font_files = (os.path.abspath(regular), os.path.abspath(bold))
+                _pdf_font = 'DocGujarati'
+    return _pdf_font or None
+
+def _pdf_markup(text):
+    # ReportLab collapses whitespace; templates line fields up with runs of spaces
+    text = html.escape(text, quote=False).replace('\t', '    ')
+    text = re.sub(r' {2,}', lambda m: '&nbsp;' * len(m.group()), text)
+    return text.replace('\n', '<br/>')
+
+def _pdf_paragraph(p, ctx):
+    """Flowables for one w:p: the paragraph, plus a PageBreak if it holds one"""
+    rl = ctx['rl']
+    fmt = ParagraphFormat(p)
+    alignment = {
+        WD_ALIGN_PARAGRAPH.CENTER: rl.enums.TA_CENTER,
+        WD_ALIGN_PARAGRAPH.RIGHT: rl.enums.TA_RIGHT,
+        WD_ALIGN_PARAGRAPH.JUSTIFY: rl.enums.TA_JUSTIFY,
+    }.get(fmt.alignment, rl.enums.TA_LEFT)
+    markup = []
+    pictures = []
+    size = ctx['size']
+    page_break = False
+    for r in p.r_lst:
+        if r.xpath('./w:br[@w:type="page"]'):
+            page_break = True
+        # Pictures follow the paragraph's text as flowables of their own
+        for extent, blip in zip(r.iter(qn('wp:extent')), r.iter(qn('a:blip'))):
+            image_part = ctx['part'].related_parts.get(blip.get(qn('r:embed')))
+            if image_part is not None:
+                pictures.append(rl.platypus.Image(io.BytesIO(image_part.blob), hAlign='LEFT',
+                                                  width=int(extent.get('cx')) / 12700,
+                                                  height=int(extent.get('cy')) / 12700))
+        text = r.text
+        if not text:
+            continue
+        font = Font(r)
+        text = _pdf_markup(text)
+        if font.bold:
+            text = f"<b>{text}</b>"
+        if font.italic:
+            text = f"<i>{text}</i>"
+        if font.underline:
+            text = f"<u>{text}</u>"
+        attrs = ""
+        if font.size:
+            attrs += f" size='{font.size.pt}'"
+            size = max(size, font.size.pt)
+        if font.color and font.color.rgb:
+            attrs += f" color='#{font.color.rgb}'"
+        markup.append(f"<font{attrs}>{text}</font>" if attrs else text)
+
+    style = rl.ParagraphStyle(
+        'docx', fontName=ctx['font'], fontSize=ctx['size'], leading=size * 1.35,
+        alignment=alignment,
+        leftIndent=fmt.left_indent.pt if fmt.left_indent else 0,
+        rightIndent=fmt.right_indent.pt if fmt.right_indent else 0,
+        firstLineIndent=fmt.first_line_indent.pt if fmt.first_line_indent else 0,
+        spaceBefore=fmt.space_before.pt if fmt.space_before else 0,
+        spaceAfter=fmt.space_after.pt if fmt.space_after is not None else ctx['space_after'],
+        shaping=1,
+    )
+    flowables = [rl.platypus.Paragraph("".join(markup) or "&nbsp;", style)]
+    if pictures:
+        flowables = (flowables if markup else []) + pictures
+    if page_break:
+        flowables.append(rl.platypus.PageBreak())
+    return flowables
+
+def _pdf_table(tbl, ctx):
+    rl = ctx['rl']
+    rows = []
+    commands = [
+        ('GRID', (0, 0), (-1, -1), 0.5, rl.colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]
+    vmerge_start = {}
+    for row_idx, tr in enumerate(tbl.tr_lst):
+        row = []
+        for tc in tr.tc_lst:
+            col = len(row)
+            if tc.vMerge == ST_Merge.CONTINUE:
+                start = vmerge_start.get(col, row_idx - 1)
+                commands.append(('SPAN', (col, start), (col + tc.grid_span - 1, row_idx)))
+                row.append("")
+            else:
+                vmerge_start[col] = row_idx
+                cell = []
+                for child in tc.iterchildren(qn('w:p'), qn('w:tbl')):
+                    if child.tag == qn('w:p'):
+                        cell.extend(f for f in _pdf_paragraph(child, ctx) if not isinstance(f, rl.platypus.PageBreak))
+                    else:
+                        cell.append(_pdf_table(child, ctx))
+                row.append(cell)
+            if tc.grid_span > 1:
+                commands.append(('SPAN', (col, row_idx), (col + tc.grid_span - 1, row_idx)))
+                row.extend([""] * (tc.grid_span - 1))
+        rows.append(row)
+    if not rows:
+        return rl.platypus.Paragraph("", rl.ParagraphStyle('empty'))
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    col_widths = None
+    grid = tbl.tblGrid
+    if grid is not None and len(grid.gridCol_lst) == width and all(c.w for c in grid.gridCol_lst):
+        col_widths = [c.w.pt for c in grid.gridCol_lst]
+        scale = min(1.0, ctx['frame_width'] / sum(col_widths))
+        col_widths = [w * scale for w in col_widths]
+    return rl.platypus.Table(rows, colWidths=col_widths, style=rl.platypus.TableStyle(commands))
+
+def _pdf_blocks(parent, ctx, story):
+    for child in parent.iterchildren(qn('w:p'), qn('w:tbl'), qn('w:sdt')):
+        if child.tag == qn('w:p'):
+            story.extend(_pdf_paragraph(child, ctx))
+        elif child.tag == qn('w:tbl'):
+            story.append(_pdf_table(child, ctx))
+        else:
+            content = child.find(qn('w:sdtContent'))
+            if content is not None:
+                _pdf_blocks(content, ctx, story)
+
+def render_direct_pdf(doc):
+    """Draw a filled Document as PDF bytes with ReportLab, keeping page size and margins"""
+    section = doc.sections[0]
+    page_width = section.page_width.pt if section.page_width else 595.3
+    page_height = section.page_height.pt if section.page_height else 841.9
+    margins = [m.pt if m is not None else 72 for m in (
+        section.left_margin, section.right_margin, section.top_margin, section.bottom_margin
+    )]
+    normal = doc.styles['Normal']
+    ctx = {
+        'rl': reportlab_api(),
+        'font': direct_pdf_font(),
+        'size': normal.font.size.pt if normal.font.size else 11,
+        'space_after': normal.paragraph_format.space_after.pt if normal.paragraph_format.space_after else 0,
+        'frame_width': page_width - margins[0] - margins[1],
+        'part': doc.part,
+    }
+
+    output = io.BytesIO()
+    pdf = ctx['rl'].platypus.SimpleDocTemplate(
+        output, pagesize=(page_width, page_height),
+        leftMargin=margins[0], rightMargin=margins[1], topMargin=margins[2], bottomMargin=margins[3],
+    )
+    story = []
+    _pdf_blocks(doc.element.body, ctx, story)
+    pdf.build(story)
+    return output.getvalue()
+
+def uses_direct_pdf(doc_list):
+    return (all(template_option(f, 'pdf_engine') == 'direct' for f in doc_list)
+            and direct_pdf_font() is not None)
+
+def try_direct_pdf(filename, data, section):
+    """PDF bytes from the direct engine if the template opts in and it can run, otherwise None"""
+    if not uses_direct_pdf([filename]):
+        return None
+    try:
+        doc = render_filled_document(filename, data, section)
+    except FileNotFoundError:
+        return None
+    try:
+        with metrics.span('pdf_direct'):
+            content = render_direct_pdf(doc)
+    except Exception:
+        app.logger.exception("Direct PDF rendering failed for %s; falling back to office", filename)
+        count_pdf_results('direct', [False])
+        metrics.inc('pdf_fallbacks_total', **{'from': 'direct', 'to': 'office'})
+        return None
+    count_pdf_results('direct', [True])
+    return content
 
-    for p in doc.paragraphs:
-        scan_text(p.text)
+# --------------------------------------------------
+# OUTPUT CACHE
+# --------------------------------------------------
+class OutputCache:
+    """Size-bounded LRU of generated files, keyed by content hash.
+
+    Entries are kept in memory, or as files under `directory` when one is
+    given. Hit and miss counts are kept for sizing the cache.
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = collections.OrderedDict()  # key -> bytes, or size on disk
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._store(os.path.basename(path), os.path.getsize(path))
+            self._evict()
+
+    def _store(self, key, value):
+        self.entries[key] = value
+        self.size += value if isinstance(value, int) else len(value)
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            key, value = self.entries.popitem(last=False)
+            self.size -= value if isinstance(value, int) else len(value)
+            if self.directory:
+                try:
+                    os.remove(os.path.join(self.directory, key))
+                except OSError:
+                    pass
 
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    scan_text(p.text)
+    def get(self, key):
+        if key is None:
+            return None
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        if not self.directory:
+            return value
+        try:
+            return read_file(os.path.join(self.directory, key))
+        except OSError:
+            return None
+
+    def put(self, key, content):
+        if key is None or len(content) > self.max_bytes:
+            return
+        if self.directory:
+            path = os.path.join(self.directory, key)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            self._store(key, len(content) if self.directory else content)
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+output_cache = OutputCache(OUTPUT_CACHE_BYTES, OUTPUT_CACHE_DIR or None)
+
+def pdf_engine_signature(doc_list):
+    """How doc_list becomes one PDF: the engine, plus the font files for the direct one"""
+    if uses_direct_pdf(doc_list):
+        return ['direct', *_pdf_font_files]
+    return ['office']
+
+def template_cache_key(compiled, data, fmt):
+    """Hash of (template content, the case values it uses, output format and PDF engine)"""
+    values = placeholder_values(compiled, data)
+    engine = pdf_engine_signature([os.path.basename(compiled.path)]) if fmt == 'pdf' else None
+    payload = json.dumps([compiled.sha256, values, fmt, engine], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def output_cache_key(filename, section, data, fmt):
+    """template_cache_key for a template by name; None if it doesn't exist"""
+    compiled = load_compiled_template(get_template_path(filename, section))
+    if compiled is None:
+        return None
+    return template_cache_key(compiled, data, fmt)
+
+def merged_cache_key(doc_list, section, data, fmt):
+    keys = [output_cache_key(filename, section, data, 'docx') for filename in doc_list]
+    if None in keys:
+        return None
+    # concat converts each template with its own engine; otherwise one engine converts them all
+    if fmt == 'pdf-concat':
+        engine = [pdf_engine_signature([filename]) for filename in doc_list]
+    elif fmt == 'pdf':
+        engine = pdf_engine_signature(doc_list)
+    else:
+        engine = None
+    return hashlib.sha256(json.dumps(['merged', keys, fmt, engine]).encode('utf-8')).hexdigest()
 
-    return found
+# --------------------------------------------------
+# BATCH RENDERING
+# --------------------------------------------------
+_render_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=RENDER_WORKERS, thread_name_prefix='render'
+)
+
+class RenderResult:
+    """Outcome of one document in a batch: `content` and its download `name` on success, `error` otherwise"""
+
+    def __init__(self, filename, name=None, content=None, error=None):
+        self.filename = filename
+        self.name = name
+        self.content = content
+        self.error = error
+
+def scratch_directory():
+    """Private directory for one request's office conversion, removed on exit"""
+    return tempfile.TemporaryDirectory(prefix='police_docs_', dir=GENERATED_DIR)
+
+def output_name(filename, fmt):
+    """Download name of a filled template, e.g. Filled_Notice_281.pdf"""
+    if fmt == 'pdf':
+        return f"Filled_{os.path.splitext(filename)[0]}.pdf"
+    return f"Filled_{filename}"
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def render_document_bytes(template_name, data, section=None, output_path=None):
+    """Fill a template into memory (or output_path); raises FileNotFoundError if it is missing"""
+    output = output_path or io.BytesIO()
+    if not generate_document(template_name, data, output, section):
+        raise FileNotFoundError("Template not found")
+    return output if output_path else output.getvalue()
+
+def render_batch(doc_list, data, section, to_pdf=False):
+    """Fill every template concurrently, yielding a RenderResult as each one finishes.
+
+    DOCX output never leaves memory. With to_pdf, templates using the direct
+    engine are drawn straight to PDF; the rest are written to a scratch
+    directory private to this batch and each is handed to the PDF worker pool
+    as soon as it is filled, so filling and conversion overlap. Anything the
+    pool can't take is converted in a single soffice run once filling is done.
+    """
+    fmt = 'pdf' if to_pdf else 'docx'
+    pdf_pool = get_pdf_pool() if to_pdf else None
+    scratch = scratch_directory() if to_pdf else None
+    try:
+        pending = {}
+        cache_keys = {}
 
-def extract_preview_from_docx(template_path, data):
-    if not os.path.exists(template_path):
-        return ""
+        def submit_fill(filename):
+            docx_path = os.path.join(scratch.name, f"Filled_{filename}") if to_pdf else None
+            future = _render_executor.submit(render_document_bytes, filename, data, section, docx_path)
+            pending[future] = (filename, docx_path, 'fill')
 
-    doc = Document(template_path)
-    html_content = "<style>"
-    html_content += """
-    .docx-preview-para { margin: 0.5em 0; line-height: 1.4; }
-    .docx-preview-table { width: 100%; margin: 0.5em 0; border-collapse: collapse; border: 1px solid #999; }
-    .docx-preview-table td { border: 1px solid #999; padding: 8px; vertical-align: top; }
-    .docx-preview-table th { border: 1px solid #999; padding: 8px; background-color: #e9ecef; font-weight: bold; }
-    .docx-preview-run { display: inline; }
-    </style>"""
+        for filename in doc_list:
+            cache_keys[filename] = key = output_cache_key(filename, section, data, fmt)
+            cached = output_cache.get(key)
+            if cached is not None:
+                yield RenderResult(filename, output_name(filename, fmt), cached)
+            elif to_pdf and uses_direct_pdf([filename]):
+                future = _render_executor.submit(try_direct_pdf, filename, data, section)
+                pending[future] = (filename, None, 'direct')
+            else:
+                submit_fill(filename)
+
+        leftovers = []
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                filename, docx_path, stage = pending.pop(future)
+                pdf_path = os.path.splitext(docx_path)[0] + '.pdf' if docx_path else None
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if stage == 'pdf':
+                        leftovers.append((filename, docx_path, pdf_path))
+                    else:
+                        yield RenderResult(filename, error=str(e) or type(e).__name__)
+                    continue
+
+                if stage == 'direct':
+                    if result is None:
+                        submit_fill(filename)
+                    else:
+                        output_cache.put(cache_keys[filename], result)
+                        yield RenderResult(filename, output_name(filename, fmt), result)
+                elif not to_pdf:
+                    output_cache.put(cache_keys[filename], result)
+                    yield RenderResult(filename, output_name(filename, fmt), result)
+                elif stage == 'fill':
+                    try:
+                        if pdf_pool is None:
+                            raise queue.Full
+                        pending[pdf_pool.submit([docx_path], [pdf_path])] = (filename, docx_path, 'pdf')
+                    except queue.Full:
+                        leftovers.append((filename, docx_path, pdf_path))
+                elif result[0]:
+                    content = read_file(pdf_path)
+                    output_cache.put(cache_keys[filename], content)
+                    yield RenderResult(filename, output_name(filename, fmt), content)
+                else:
+                    leftovers.append((filename, docx_path, pdf_path))
+
+        if leftovers:
+            converted = generate_pdfs_from_docx([(d, p) for _, d, p in leftovers])
+            for (filename, _docx_path, pdf_path), ok in zip(leftovers, converted):
+                if ok:
+                    content = read_file(pdf_path)
+                    output_cache.put(cache_keys[filename], content)
+                    yield RenderResult(filename, output_name(filename, fmt), content)
+                else:
+                    yield RenderResult(filename, error="PDF conversion failed")
+    finally:
+        if scratch is not None:
+            scratch.cleanup()
+
+def format_failures(failures):
+    return "".join(f"{r.filename}: {r.error}\n" for r in failures)
+
+class _ZipSink:
+    """Write-only stream that hands over whatever zipfile has written so far"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
 
-    for p in doc.paragraphs:
-        # Create a copy and replace placeholders
-        p_copy = Document().add_paragraph()
-        for run in p.runs:
-            p_copy.add_run(run.text)
-        replace_text_in_paragraph(p_copy, data)
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(results):
+    """Yield a ZIP archive chunk by chunk as RenderResults arrive; failures go into FAILURE_REPORT_NAME"""
+    sink = _ZipSink()
+    failures = []
+    with zipfile.ZipFile(sink, 'w') as zipf:
+        for result in results:
+            if result.error:
+                failures.append(result)
+                continue
+            with metrics.span('zip'):
+                zipf.writestr(result.name, result.content)
+            yield sink.pop()
+        if failures:
+            zipf.writestr(FAILURE_REPORT_NAME, format_failures(failures))
+    yield sink.pop()
+
+def zip_response(results, download_name):
+    return Response(
+        stream_with_context(stream_zip(results)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
 
-        # Build HTML with formatting
-        p_html = "<p class='docx-preview-para' style='"
-        
-        # Paragraph alignment
-        alignment = p.alignment
-        if alignment == 1:  # CENTER
-            p_html += "text-align: center; "
-        elif alignment == 2:  # RIGHT
-            p_html += "text-align: right; "
-        elif alignment == 3:  # JUSTIFY
-            p_html += "text-align: justify; "
-        
-        # Paragraph indentation/spacing
-        if p.paragraph_format.left_indent:
-            p_html += f"margin-left: {p.paragraph_format.left_indent.pt}pt; "
-        if p.paragraph_format.right_indent:
-            p_html += f"margin-right: {p.paragraph_format.right_indent.pt}pt; "
-        if p.paragraph_format.space_before:
-            p_html += f"margin-top: {p.paragraph_format.space_before.pt}pt; "
-        if p.paragraph_format.space_after:
-            p_html += f"margin-bottom: {p.paragraph_format.space_after.pt}pt; "
-        
-        p_html += "'>"
+# --------------------------------------------------
+# MERGED DOCUMENTS
+# --------------------------------------------------
+class MergeComposer(Composer):
+    """docxcompose Composer that keeps its style lookups between appends.
+
+    Composer.append rebuilds the style id/name maps of both documents for
+    every part. Parts rendered from the same template have identical style
+    tables, and the master's only change when a style is copied in, so both
+    maps are cached: per template key, and per size of the master's styles.
+    """
+
+    def __init__(self, doc):
+        super().__init__(doc)
+        self._part_key = None
+        self._part_style_maps = {}
+        self._master_style_map = (None, None)
+
+    def append_part(self, doc, key):
+        self._part_key = key
+        self.append(doc)
+
+    def _create_style_id_mapping(self, doc):
+        id2name = self._part_style_maps.get(self._part_key) if self._part_key else None
+        if id2name is None:
+            id2name = {s.style_id: s.name for s in doc.styles}
+            if self._part_key:
+                self._part_style_maps[self._part_key] = id2name
+        self._style_id2name = id2name
+
+        size = len(self.doc.styles.element)
+        if self._master_style_map[0] != size:
+            self._master_style_map = (size, {s.name: s.style_id for s in self.doc.styles})
+        self._style_name2id = self._master_style_map[1]
+
+def build_merged_document(doc_list, data, section, progress=None):
+    """Fill every template (concurrently) and compose them into one Document.
+
+    Parts go straight from the compiled-template cache into the composer with
+    no save/reload in between. Returns (document, failures); a merged file
+    missing a part is not usable, so document is None when anything failed.
+    progress(filename, error) is called as each part is filled.
+    """
+    futures = [
+        (filename, _render_executor.submit(render_filled_document, filename, data, section))
+        for filename in doc_list
+    ]
+    parts = []
+    failures = []
+    for filename, future in futures:
+        error = None
+        try:
+            parts.append((filename, future.result()))
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            failures.append(RenderResult(filename, error=error))
+        if progress:
+            progress(filename, error)
+    if failures:
+        return None, failures
+
+    master_doc = parts[0][1]
+    with metrics.span('merge'):
+        composer = MergeComposer(master_doc)
+        for filename, doc in parts[1:]:
+            master_doc.add_page_break()
+            composer.append_part(doc, get_template_path(filename, section))
+    return master_doc, []
+
+_pypdf = None
+
+def pypdf_api():
+    """pypdf, imported on first use; None when it isn't installed (pip install pypdf)"""
+    global _pypdf
+    if _pypdf is None:
+        try:
+            import pypdf
+        except ImportError:
+            app.logger.warning("pypdf is not installed; merged PDFs are converted from the merged DOCX")
+            _pypdf = False
+        else:
+            _pypdf = pypdf
+    return _pypdf or None
+
+def document_title(filename):
+    """Name of a template in merged PDF bookmarks and page labels"""
+    return template_option(filename, 'title') or os.path.splitext(filename)[0].replace('_', ' ')
+
+def concat_pdfs(parts):
+    """Join [(title, pdf_bytes)] into one PDF with a bookmark per part and
+    page labels like "Notice 281 - 2"; parts are dropped as they are copied.
+
+    Raises RuntimeError naming the part when a converter produced a PDF pypdf
+    can't read.
+    """
+    writer = pypdf_api().PdfWriter()
+    for title, content in parts:
+        start = len(writer.pages)
+        try:
+            writer.append(io.BytesIO(content), outline_item=title, import_outline=False)
+        except Exception as e:
+            # pypdf raises its own errors and plain ValueError/KeyError for broken files
+            raise RuntimeError(f"Could not read the PDF of {title}: {e}") from e
+        if len(writer.pages) > start:
+            writer.set_page_label(start, len(writer.pages) - 1, style='/D', prefix=f"{title} - ")
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def concat_merged_pdf(doc_list, data, section, progress=None):
+    """Merged PDF built from per-template PDFs.
+
+    Each template is converted separately through render_batch: concurrently,
+    with the direct engine where it applies, and through the output cache, so
+    PDFs already made for single downloads are reused and a template that
+    fails doesn't take the others' conversions down with it.
+    """
+    results = {}
+    for result in render_batch(doc_list, data, section, to_pdf=True):
+        results[result.filename] = result
+        if progress:
+            progress(result.filename, result.error)
+    failures = [results[filename] for filename in doc_list if results[filename].error]
+    if failures:
+        raise RuntimeError("Could not generate:\n" + format_failures(failures))
+    with metrics.span('merge'):
+        return concat_pdfs((document_title(f), results.pop(f).content) for f in doc_list)
+
+def render_merged(doc_list, data, section, fmt, progress=None):
+    """Merged DOCX or PDF bytes for doc_list, cached; raises RuntimeError with a user-facing message"""
+    concat = fmt == 'pdf' and MERGED_PDF_MODE == 'concat' and pypdf_api() is not None
+    cache_key = merged_cache_key(doc_list, section, data, 'pdf-concat' if concat else fmt)
+    content = output_cache.get(cache_key)
+    if content is not None:
+        if progress is not None:
+            for filename in doc_list:
+                progress(filename, None)
+        return content
+
+    if concat:
+        content = concat_merged_pdf(doc_list, data, section, progress)
+        output_cache.put(cache_key, content)
+        return content
+
+    merged, failures = build_merged_document(doc_list, data, section, progress)
+    if failures:
+        raise RuntimeError("Could not generate:\n" + format_failures(failures))
+
+    if fmt == 'docx':
+        output = io.BytesIO()
+        with metrics.span('save'):
+            merged.save(output)
+        content = output.getvalue()
+    elif uses_direct_pdf(doc_list):
+        try:
+            with metrics.span('pdf_direct'):
+                content = render_direct_pdf(merged)
+            count_pdf_results('direct', [True])
+        except Exception:
+            app.logger.exception("Direct PDF rendering failed for merged document; falling back to office")
+            count_pdf_results('direct', [False])
+            metrics.inc('pdf_fallbacks_total', **{'from': 'direct', 'to': 'office'})
+    if content is None:
+        with scratch_directory() as scratch_dir:
+            base_path = os.path.join(scratch_dir, "Merged_Master.docx")
+            merged_pdf = os.path.join(scratch_dir, "Merged_Master.pdf")
+            with metrics.span('save'):
+                merged.save(base_path)
+            if not generate_pdf_from_docx(base_path, merged_pdf):
+                raise RuntimeError("PDF generation failed")
+            content = read_file(merged_pdf)
+    output_cache.put(cache_key, content)
+    return content
 
-        # Add runs with formatting
-        for run in p_copy.runs:
-            run_html = "<span class='docx-preview-run' style='"
-            
-            # Font properties
-            if run.font.size:
-                run_html += f"font-size: {run.font.size.pt}pt; "
-            if run.font.bold:
-                run_html += "font-weight: bold; "
-            if run.font.italic:
-                run_html += "font-style: italic; "
-            if run.font.underline:
-                run_html += "text-decoration: underline; "
-            if run.font.color and run.font.color.rgb:
-                run_html += f"color: #{str(run.font.color.rgb)}; "
-            
-            run_html += "'>" + (run.text or "") + "</span>"
-            p_html += run_html
+# --------------------------------------------------
+# BULK GENERATION
+# --------------------------------------------------
+def iter_case_records(stream, filename):
+    """Yield case dicts from a CSV or JSON Lines byte stream, one at a time.
+
+    Unparseable JSON lines are yielded as {"_error": ...} so one bad record
+    doesn't abort the batch.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        for line_no, line in enumerate(text, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = {"_error": f"line {line_no}: {e}"}
+            yield record if isinstance(record, dict) else {"_error": f"line {line_no}: not an object"}
+    else:
+        yield from csv.DictReader(text)
+
+def case_folder_name(index, record):
+    name = " ".join(str(record.get(f) or "").strip() for f in ("acc_name", "acc_surname")).strip()
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', name)[:60].strip(' .')
+    return f"{index:04d}_{name or 'case'}"
+
+def render_case_bundle(index, record):
+    """Render every document for one case record; runs in a worker process"""
+    folder = case_folder_name(index, record)
+    if record.get("_error"):
+        return [RenderResult(folder, error=record["_error"])]
+
+    data = {field: str(record.get(field) or "").strip() for field in REQUIRED_FIELDS}
+    section = data.get('offence_section') or 'GENERAL'
+    doc_list = section_templates(section)
+    results = []
+    for filename in doc_list:
+        name = f"{folder}/{output_name(filename, 'docx')}"
+        try:
+            results.append(RenderResult(name, name, render_document_bytes(filename, data, section)))
+        except Exception as e:
+            results.append(RenderResult(name, error=str(e) or type(e).__name__))
+    return results
+
+def bulk_render(records, workers=BULK_WORKERS):
+    """Render many case records in a process pool, yielding RenderResults as cases finish.
+
+    At most 2 * workers cases are in flight, so memory stays flat however
+    long the input is.
+    """
+    # Not fork: another request thread may hold a lock (metrics, registry,
+    # template cache) at fork time, and the child would wait on it forever
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    try:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    except (OSError, NotImplementedError):
+        # No multiprocessing support (e.g. serverless sandboxes)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        pending = set()
+        for index, record in enumerate(records, 1):
+            pending.add(executor.submit(render_case_bundle, index, record))
+            if len(pending) >= workers * 2:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield from future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield from future.result()
 
-        p_html += "</p>"
-        
-        # Only add non-empty paragraphs
-        if p_copy.text.strip():
-            html_content += p_html
+# --------------------------------------------------
+# GENERATION JOBS
+# --------------------------------------------------
+JOB_DOWNLOAD_NAMES = {
+    ('zip', 'docx'): "All_Documents.zip",
+    ('zip', 'pdf'): "All_Documents_PDF.zip",
+    ('merged', 'docx'): "Merged_Master.docx",
+    ('merged', 'pdf'): "Merged_Master.pdf",
+}
+
+class GenerationJob:
+    """One queued single / zip / merged generation and its per-document progress"""
+
+    def __init__(self, kind, fmt, doc_list, data, section):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fmt = fmt
+        self.doc_list = list(doc_list)
+        self.data = dict(data)
+        self.section = section
+        self.status = 'queued'
+        self.documents = {filename: 'pending' for filename in self.doc_list}
+        self.error = None
+        self.path = None
+        self.created = time.time()
+        self.finished = None
+        if kind == 'single':
+            self.download_name = output_name(self.doc_list[0], fmt)
         else:
-            # Add empty paragraph for spacing
-            html_content += "<p class='docx-preview-para' style='height: 0.5em;'></p>"
+            self.download_name = JOB_DOWNLOAD_NAMES[kind, fmt]
+
+    @property
+    def mimetype(self):
+        if self.kind == 'zip':
+            return 'application/zip'
+        return DOCX_MIMETYPE if self.fmt == 'docx' else 'application/pdf'
+
+    def mark(self, filename, error=None):
+        self.documents[filename] = 'failed' if error else 'done'
+
+    def state(self):
+        """What other processes need to report and serve the job (see JobManager)"""
+        return dict(self.to_dict(), documents=dict(self.documents), path=self.path,
+                    created=self.created, finished=self.finished)
+
+    @classmethod
+    def from_state(cls, state):
+        job = cls(state['type'], state['format'], list(state['documents']), {}, None)
+        job.id = state['job_id']
+        job.status = state['status']
+        job.documents = state['documents']
+        job.error = state['error']
+        job.path = state['path']
+        job.created = state['created']
+        job.finished = state['finished']
+        job.data = None
+        return job
+
+    def to_dict(self):
+        documents = dict(self.documents)
+        return {
+            'job_id': self.id,
+            'type': self.kind,
+            'format': self.fmt,
+            'status': self.status,
+            'documents': documents,
+            'completed': sum(1 for state in documents.values() if state != 'pending'),
+            'total': len(documents),
+            'error': self.error,
+            'expires_at': self.finished + JOB_TTL if self.finished else None,
+        }
+
+class JobManager:
+    """Runs GenerationJobs on a fixed number of threads.
+
+    Results are written under `directory` and dropped JOB_TTL seconds after
+    the job finishes. Each job's state is also kept there as <id>.json,
+    rewritten on every change, so any process sharing the directory (the
+    gunicorn workers) can report and serve a job another one is running.
+    Expiry is checked whenever jobs are submitted or looked up, so an idle
+    server does no work.
+    """
+
+    def __init__(self, workers, queue_size, ttl, directory):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.directory = directory
+        self.jobs = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Leftovers from a previous run
+        self.sweep()
+
+    def sweep(self):
+        """Remove results and states not touched for ttl seconds, whichever process wrote them"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
 
-    # Process tables
-    for table in doc.tables:
-        html_content += "<table class='docx-preview-table'>"
-        
-        for row_idx, row in enumerate(table.rows):
-            html_content += "<tr>"
-            
-            for cell in row.cells:
-                # Check if this is a header cell (first row)
-                is_header = row_idx == 0
-                tag = "th" if is_header else "td"
-                
-                cell_html = f"<{tag}>"
-                
-                for p in cell.paragraphs:
-                    # Create copy and replace placeholders
-                    p_copy = Document().add_paragraph()
-                    for run in p.runs:
-                        p_copy.add_run(run.text)
-                    replace_text_in_paragraph(p_copy, data)
-                    
-                    # Build cell paragraph
-                    cell_p_html = "<div style='"
-                    if p.alignment == 1:  # CENTER
-                        cell_p_html += "text-align: center; "
-                    elif p.alignment == 2:  # RIGHT
-                        cell_p_html += "text-align: right; "
-                    cell_p_html += "'>"
-                    
-                    # Add runs
-                    for run in p_copy.runs:
-                        run_text = run.text or ""
-                        if run.font.bold:
-                            run_text = f"<b>{run_text}</b>"
-                        if run.font.italic:
-                            run_text = f"<i>{run_text}</i>"
-                        cell_p_html += run_text
-                    
-                    cell_p_html += "</div>"
-                    cell_html += cell_p_html
-                
-                cell_html += f"</{tag}>"
-                html_content += cell_html
-            
-            html_content += "</tr>"
-        
-        html_content += "</table>"
+    def submit(self, kind, fmt, doc_list, data, section):
+        """Queue a job; raises queue.Full when queue_size jobs are already pending"""
+        self.expire()
+        with self.lock:
+            active = sum(1 for job in self.jobs.values() if job.finished is None)
+            if active >= self.queue_size:
+                raise queue.Full
+            job = GenerationJob(kind, fmt, doc_list, data, section)
+            self.jobs[job.id] = job
+        self.save(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        self.expire()
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and re.fullmatch(r'[0-9a-f]{32}', job_id):
+            # Submitted through another worker process
+            try:
+                with open(self.state_path(job_id), encoding='utf-8') as f:
+                    job = GenerationJob.from_state(json.load(f))
+            except (OSError, ValueError, KeyError):
+                return None
+            if job.finished and job.finished < time.time() - self.ttl:
+                return None
+        return job
+
+    def state_path(self, job_id):
+        return os.path.join(self.directory, job_id + '.json')
+
+    def save(self, job):
+        path = self.state_path(job.id)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(job.state(), f)
+            os.replace(temp_path, path)
+        except OSError:
+            app.logger.exception("Could not save state of job %s", job.id)
+
+    def mark(self, job, filename, error=None):
+        job.mark(filename, error)
+        self.save(job)
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            expired = [job for job in self.jobs.values() if job.finished and job.finished < cutoff]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            for path in [job.path, self.state_path(job.id)]:
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        if expired:
+            self.sweep()
+
+    def _run(self, job):
+        job.status = 'running'
+        self.save(job)
+        path = os.path.join(self.directory, job.id)
+        progress = functools.partial(self.mark, job)
+        try:
+            if job.kind == 'merged':
+                content = render_merged(job.doc_list, job.data, job.section, job.fmt, progress)
+                with open(path, 'wb') as f:
+                    f.write(content)
+            elif job.kind == 'zip':
+                results = render_batch(job.doc_list, job.data, job.section, to_pdf=job.fmt == 'pdf')
+                with open(path, 'wb') as f:
+                    for chunk in stream_zip(self._track(results, progress)):
+                        f.write(chunk)
+            else:
+                result = next(render_batch(job.doc_list, job.data, job.section, to_pdf=job.fmt == 'pdf'))
+                progress(result.filename, result.error)
+                if result.error:
+                    raise RuntimeError(result.error)
+                with open(path, 'wb') as f:
+                    f.write(result.content)
+            job.path = path
+            job.status = 'done'
+        except Exception as e:
+            app.logger.exception("Generation job %s failed", job.id)
+            job.error = str(e) or type(e).__name__
+            job.status = 'failed'
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        finally:
+            job.finished = time.time()
+            # The case data isn't needed once the result exists
+            job.data = None
+            self.save(job)
 
-    return html_content
+    @staticmethod
+    def _track(results, progress):
+        for result in results:
+            progress(result.filename, result.error)
+            yield result
+
+job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_TTL, JOB_DIR)
+
+# --------------------------------------------------
+# STARTUP
+# --------------------------------------------------
+# Reported by /ready and /metrics
+startup_stats = {
+    "ready": False,
+    "import_seconds": None,
+    "warm_up_seconds": None,
+    "templates_compiled": 0,
+    "first_request_seconds": None,
+}
+# Probes don't count as the first real request
+STARTUP_PROBE_ENDPOINTS = {'ready_endpoint', 'metrics_endpoint', 'static'}
+
+def warm_up():
+    """Load the registry and indexes and compile every template before serving.
+
+    Precompiled copies and the placeholder manifest are build output, not
+    checked in; missing or stale ones are (re)built here when the disk is
+    writable. Under gunicorn with preload_app (gunicorn.conf.py) this runs
+    once in the master, so forked workers share the parsed templates
+    copy-on-write. It runs on the calling thread only: executor threads
+    started before a fork would not exist in the workers.
+    """
+    started = time.perf_counter()
+    registry = template_registry()
+    if precompiled_stale():
+        try:
+            precompile_templates(report=app.logger.debug)
+        except OSError:
+            app.logger.warning("Could not write %s; templates are filled from the originals", PRECOMPILED_DIR)
+    refresh_placeholder_index()
+    compiled = 0
+    for path in iter_template_files():
+        if load_compiled_template(path) is not None:
+            compiled += 1
+    if any(options.get('pdf_engine') == 'direct' for options in registry.options.values()):
+        direct_pdf_font()
+    startup_stats.update(
+        ready=True,
+        warm_up_seconds=round(time.perf_counter() - started, 3),
+        templates_compiled=compiled,
+    )
+    app.logger.info("Warm-up: %d templates compiled in %.2fs (module import took %.2fs)",
+                    compiled, startup_stats['warm_up_seconds'], startup_stats['import_seconds'] or 0)
 
 # --------------------------------------------------
 # API ENDPOINTS FOR LOCALSTORAGE SYNC
 # --------------------------------------------------
 
-@app.route('/api/save_data', methods=['POST'])
+@app.route('/api/save_data', methods=['POST', 'PATCH'])
 def api_save_data():
     data = request.get_json() or {}
-    save_data(data)
-    return {'status': 'success'}, 200
+    # PATCH sends only the fields that changed; POST replaces the whole case
+    if request.method == 'PATCH':
+        patch_data(data)
+    else:
+        save_data(data)
+    return {'status': 'success', 'case_id': session.get('case_id')}, 200
 
 @app.route('/api/load_data', methods=['GET'])
 def api_load_data():
     data = load_data()
     return data, 200
 
+@app.route('/api/cases/unlock', methods=['POST'])
+def api_unlock_cases():
+    """Give this session access to past cases when the right CASE_ACCESS_KEY is sent"""
+    if not CASE_ACCESS_KEY:
+        return {'status': 'error', 'message': 'Past cases are not enabled on this server'}, 403
+    key = str((request.get_json(silent=True) or {}).get('key', ''))
+    if not hmac.compare_digest(key.encode('utf-8'), CASE_ACCESS_KEY.encode('utf-8')):
+        return {'status': 'error', 'message': 'Wrong access key'}, 401
+    session['case_access'] = case_access_token()
+    return {'status': 'success'}, 200
+
+@app.route('/api/cases/lock', methods=['POST'])
+def api_lock_cases():
+    session.pop('case_access', None)
+    return {'status': 'success'}, 200
+
+@app.route('/api/cases', methods=['GET'])
+@case_access_required
+def api_list_cases():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    offset = request.args.get('offset', 0, type=int)
+    return {'cases': case_store.list(limit, offset), 'current': session.get('case_id')}, 200
+
+@app.route('/api/cases/search', methods=['GET'])
+@case_access_required
+def api_search_cases():
+    """Typeahead over past cases by name, mobile or ID number"""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', CASE_SEARCH_LIMIT, type=int), 50)
+    if len(query.strip()) < 2:
+        return {'results': []}, 200
+    return {'results': case_store.search(query, limit)}, 200
+
+@app.route('/api/images', methods=['POST'])
+def api_upload_image():
+    """Store an uploaded photo or signature; the returned image_id goes into the case's image field"""
+    if request.content_length and request.content_length > MAX_IMAGE_BYTES + 64 * 1024:
+        return {'status': 'error', 'message': 'Image too large'}, 413
+    upload = request.files.get('image')
+    if upload is None:
+        return {'status': 'error', 'message': 'No image uploaded'}, 400
+    content = upload.read(MAX_IMAGE_BYTES + 1)
+    if len(content) > MAX_IMAGE_BYTES:
+        return {'status': 'error', 'message': 'Image too large'}, 413
+    try:
+        image_id = store_image(content)
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}, 400
+    return {'status': 'success', 'image_id': image_id}, 201
+
+@app.route('/api/images/<image_id>', methods=['GET'])
+def api_get_image(image_id):
+    """A thumbnail of an uploaded image; IDs are content hashes, so it never changes"""
+    fitted = fitted_image(image_id, THUMBNAIL_FRAME)
+    if fitted is None:
+        return {'status': 'error', 'message': 'Image not found'}, 404
+    content = fitted[0]
+    response = send_file(io.BytesIO(content), mimetype=DocxImage.from_blob(content).content_type)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/cases', methods=['POST'])
+def api_new_case():
+    """Start a new case (optionally pre-filled) and make it the session's current one"""
+    session['case_id'] = case_store.create(request.get_json(silent=True) or {})
+    return {'status': 'success', 'case_id': session['case_id']}, 201
+
+@app.route('/api/cases/<case_id>', methods=['GET'])
+@case_access_required
+def api_get_case(case_id):
+    data = case_store.get(case_id)
+    if data is None:
+        return {'status': 'error', 'message': 'Case not found'}, 404
+    return data, 200
+
+@app.route('/api/cases/<case_id>', methods=['PATCH'])
+@case_access_required
+def api_patch_case(case_id):
+    data = case_store.update(case_id, request.get_json() or {})
+    if data is None:
+        return {'status': 'error', 'message': 'Case not found'}, 404
+    return data, 200
+
+@app.route('/api/cases/<case_id>/open', methods=['POST'])
+@case_access_required
+def api_open_case(case_id):
+    if case_store.get(case_id) is None:
+        return {'status': 'error', 'message': 'Case not found'}, 404
+    session['case_id'] = case_id
+    return {'status': 'success', 'case_id': case_id}, 200
+
+@app.route('/api/bulk_generate', methods=['POST'])
+def api_bulk_generate():
+    upload = request.files.get('cases')
+    if upload is None or not upload.filename:
+        return {'status': 'error', 'message': 'Upload a CSV or JSON Lines file as "cases"'}, 400
+    # Flask closes the request's upload before a streamed body starts, so keep a copy
+    source = tempfile.TemporaryFile(dir=GENERATED_DIR)
+    shutil.copyfileobj(upload.stream, source)
+    source.seek(0)
+    filename = upload.filename
+
+    def results():
+        with source:
+            yield from bulk_render(iter_case_records(source, filename))
+
+    return zip_response(results(), "Bulk_Documents.zip")
+
+@app.route('/api/jobs', methods=['POST'])
+def api_create_job():
+    """Queue a generation job: {"type": "single"|"zip"|"merged", "format": "docx"|"pdf", "filename": ...}"""
+    body = request.get_json(silent=True) or {}
+    kind = body.get('type', 'zip')
+    fmt = body.get('format', 'docx')
+    if kind not in ('single', 'zip', 'merged') or fmt not in ('docx', 'pdf'):
+        return {'status': 'error', 'message': 'Unknown job type or format'}, 400
+
+    data = load_data()
+    section = data.get('offence_section', 'GENERAL')
+    if kind == 'single':
+        if not body.get('filename'):
+            return {'status': 'error', 'message': 'filename is required for single jobs'}, 400
+        # Only the case's own templates; this also keeps paths inside TEMPLATE_DIR
+        if body['filename'] not in section_templates(section):
+            return {'status': 'error', 'message': 'Template not found'}, 404
+        doc_list = [body['filename']]
+    else:
+        doc_list = section_templates(section)
+    if not doc_list:
+        return {'status': 'error', 'message': 'No documents to generate'}, 400
+
+    try:
+        job = job_manager.submit(kind, fmt, doc_list, data, section)
+    except queue.Full:
+        return {'status': 'error', 'message': 'Too many jobs queued, try again shortly'}, 503
+    return {
+        'status': 'queued',
+        'job_id': job.id,
+        'status_url': url_for('api_job_status', job_id=job.id),
+    }, 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return {'status': 'error', 'message': 'Job not found or expired'}, 404
+    result = job.to_dict()
+    if job.status == 'done':
+        result['download_url'] = url_for('api_job_download', job_id=job.id)
+    return result, 200
+
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+def api_job_download(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return {'status': 'error', 'message': 'Job not found or expired'}, 404
+    if job.status != 'done':
+        return {'status': 'error', 'message': f'Job is {job.status}'}, 409
+    return send_file(job.path, as_attachment=True,
+                     download_name=job.download_name, mimetype=job.mimetype)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    if METRICS_ENABLED:
+        _request_timings.set({} if SERVER_TIMING else None)
+
+@app.after_request
+def finish_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    if startup_stats['first_request_seconds'] is None and request.endpoint not in STARTUP_PROBE_ENDPOINTS:
+        startup_stats['first_request_seconds'] = round(elapsed, 3)
+        app.logger.info("First request (%s) served in %.1f ms", request.path, elapsed * 1000)
+    metrics.observe('request_duration_seconds', elapsed, endpoint=request.endpoint or 'unknown')
+    timings = _request_timings.get()
+    if timings is not None:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers['Server-Timing'] = ", ".join(entries)
+    return response
+
+@app.route('/ready', methods=['GET'])
+def ready_endpoint():
+    """Readiness probe: 503 until warm_up() has compiled the templates"""
+    body = dict(startup_stats, status='ready' if startup_stats['ready'] else 'warming_up')
+    return body, 200 if startup_stats['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    cache = output_cache.stats()
+    samples = [
+        ('output_cache_hits_total', 'counter', 'Output cache hits', cache['hits']),
+        ('output_cache_misses_total', 'counter', 'Output cache misses', cache['misses']),
+        ('output_cache_entries', 'gauge', 'Documents held in the output cache', cache['entries']),
+        ('output_cache_bytes', 'gauge', 'Bytes held in the output cache', cache['bytes']),
+        ('compiled_templates', 'gauge', 'Templates parsed and held in memory', len(_template_cache)),
+    ]
+    for name in ('import_seconds', 'warm_up_seconds', 'first_request_seconds'):
+        if startup_stats[name] is not None:
+            samples.append((f'startup_{name}', 'gauge', f"Startup: {name.replace('_', ' ')}", startup_stats[name]))
+    return Response(metrics.render(samples), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache_stats', methods=['GET'])
+def api_cache_stats():
+    return output_cache.stats(), 200
+
+# --------------------------------------------------
+# HTTP CACHING AND COMPRESSION
+# --------------------------------------------------
+# Pages and previews carry a strong ETag computed from everything they are
+# rendered from, checked before any rendering, so a repeat visit over a slow
+# link costs a 304. Compressed bodies get the encoding appended to the ETag
+# ("<hash>-gzip"), as a strong tag must differ per byte representation.
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+ETAG_ENCODING_SUFFIXES = ('-br', '-gzip')
+# Changes whenever app.py does, since the code shapes every page too
+APP_REVISION = str(os.stat(__file__).st_mtime_ns)
+_brotli = None
+
+def brotli_api():
+    """The brotli module, imported on first use; None when it isn't installed (pip install brotli)"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            _brotli = False
+        else:
+            _brotli = brotli
+    return _brotli or None
+
+@functools.lru_cache(maxsize=32)
+def _template_source_hash(name, mtime):
+    source = app.jinja_env.loader.get_source(app.jinja_env, name)[0]
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def template_source_hash(name):
+    path = os.path.join(app.root_path, app.template_folder, name)
+    return _template_source_hash(name, os.stat(path).st_mtime_ns)
+
+def request_etags():
+    """{ETag without encoding suffix: ETag as sent} for If-None-Match, weak or strong"""
+    tags = {}
+    for tag in request.if_none_match.as_set(include_weak=True):
+        base = tag
+        for suffix in ETAG_ENCODING_SUFFIXES:
+            if tag.endswith(suffix):
+                base = tag[:-len(suffix)]
+                break
+        tags[base] = tag
+    return tags
+
+def conditional_response(etag, render, mimetype='text/html'):
+    """304 when the client already has etag; otherwise render() is called for the body"""
+    sent = request_etags().get(etag)
+    if sent is not None:
+        # Echo the tag of the representation the client holds
+        response = Response(status=304)
+        response.set_etag(sent)
+    else:
+        response = Response(render(), mimetype=mimetype)
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    # Pages depend on the case in the session cookie
+    response.vary.add('Cookie')
+    return response
+
+def render_page(template_name, **context):
+    """render_template behind an ETag of the template source and its context"""
+    payload = json.dumps([APP_REVISION, template_source_hash(template_name), context],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    etag = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return conditional_response(etag, lambda: render_template(template_name, **context))
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli_api() is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+        return 'br'
+    return 'gzip' if accepted['gzip'] else None
+
+def _compressor(encoding):
+    """(compress(chunk), flush(), finish()) for one response body"""
+    if encoding == 'br':
+        compressor = brotli_api().Compressor(quality=min(COMPRESS_LEVEL, 11))
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+def _compress_stream(chunks, encoding):
+    """Compress a streamed body chunk by chunk, flushing after each so the
+    client still gets every part as soon as it is produced"""
+    compress, sync, finish = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compress(chunk) + sync()
+        if data:
+            yield data
+    yield finish()
+
+@app.after_request
+def compress_response(response):
+    if (COMPRESS_MIN_BYTES <= 0 or response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        compress, _sync, finish = _compressor(encoding)
+        response.set_data(compress(body) + finish())
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+@app.after_request
+def cache_static_files(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+    return response
+
 # --------------------------------------------------
 # ROUTES
 # --------------------------------------------------
 
+@app.route('/new_case', methods=['POST'])
+def new_case():
+    """Leave the current case (it stays saved) and start from an empty form"""
+    session.pop('case_id', None)
+    return redirect(url_for('home'))
+
 @app.route('/', methods=['GET', 'POST'])
 def home():
     data = load_data()
@@ -380,6 +3507,8 @@ def home():
         # Update data with form submission
         for field in REQUIRED_FIELDS:
             data[field] = request.form.get(field, "")
+        for field in IMAGE_FIELDS:
+            data[field] = request.form.get(field, data.get(field, ""))
         
         save_data(data)
         
@@ -387,7 +3516,11 @@ def home():
         if 'proceed' in request.form:
             return redirect(url_for('documents'))
             
-    return render_template('index.html', data=data, fields=REQUIRED_FIELDS)
+    registry = template_registry()
+    return render_page('index.html', data=data, fields=REQUIRED_FIELDS,
+                       sections=registry.sections, default_section=DEFAULT_SECTION,
+                       selected_section=registry.resolve(data.get('offence_section')),
+                       case_search=bool(CASE_ACCESS_KEY), case_access=has_case_access())
 
 @app.route('/documents', methods=['GET', 'POST'])
 def documents():
@@ -402,244 +3535,224 @@ def documents():
 
     # 2. Determine Documents based on Offence Section
     section = data.get('offence_section', 'GENERAL')
-    # Default to 'GENERAL' if section not in map
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
+    # Unknown sections get DEFAULT_SECTION's templates
+    doc_list = section_templates(section)
     
-    # 3. Check for Missing Data (only placeholders used in selected templates)
+    # 3. Check for Missing Data (only placeholders used in selected templates);
+    # derived placeholders count as filled when their inputs are there
     required_in_docs = set()
+    doc_placeholders = {}
     for filename in doc_list:
-        template_path = get_template_path(filename, section)
-        required_in_docs.update(extract_placeholders_from_docx(template_path))
-
-    missing_fields = [f for f in REQUIRED_FIELDS if f in required_in_docs and not data.get(f)]
+        placeholders = template_placeholders(filename, section)
+        required_in_docs.update(placeholders)
+        # Also tells the page which previews to refresh when a field is edited
+        doc_placeholders[filename] = sorted(set().union(*map(field_inputs, placeholders)))
+
+    missing = set()
+    for name in required_in_docs:
+        if not field_value(data, name):
+            missing |= missing_inputs(data, name)
+    missing_fields = [f for f in REQUIRED_FIELDS if f in missing]
     
-    return render_template('documents.html', 
-                           data=data, 
-                           docs=doc_list, 
-                           missing_fields=missing_fields,
-                           section=section)
+    return render_page('documents.html',
+                       data=data,
+                       docs=doc_list,
+                       doc_placeholders=doc_placeholders,
+                       missing_fields=missing_fields,
+                       section=section)
 
 @app.route('/download_single/<filename>')
 def download_single(filename):
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    output_path = os.path.join(GENERATED_DIR, f"Filled_{filename}")
-    
-    success = generate_document(filename, data, output_path, section)
-    if success:
-        @after_this_request
-        def cleanup(response):
-            try:
-                os.remove(output_path)
-            except:
-                pass
-            return response
-        return send_file(output_path, as_attachment=True)
-    return "Template not found", 404
+
+    cache_key = output_cache_key(filename, section, data, 'docx')
+    content = output_cache.get(cache_key)
+    if content is None:
+        try:
+            content = render_document_bytes(filename, data, section)
+        except FileNotFoundError:
+            return "Template not found", 404
+        output_cache.put(cache_key, content)
+    return send_file(io.BytesIO(content), as_attachment=True,
+                     download_name=output_name(filename, 'docx'), mimetype=DOCX_MIMETYPE)
 
 @app.route('/download_single_pdf/<filename>')
 def download_single_pdf(filename):
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    output_docx = os.path.join(GENERATED_DIR, f"Filled_{filename}")
-    output_pdf = os.path.join(GENERATED_DIR, f"Filled_{os.path.splitext(filename)[0]}.pdf")
+    pdf_name = output_name(filename, 'pdf')
 
-    success = generate_document(filename, data, output_docx, section)
-    if not success:
-        return "Template not found", 404
+    cache_key = output_cache_key(filename, section, data, 'pdf')
+    content = output_cache.get(cache_key)
+    if content is None:
+        content = try_direct_pdf(filename, data, section)
+    if content is None:
+        with scratch_directory() as scratch_dir:
+            output_docx = os.path.join(scratch_dir, output_name(filename, 'docx'))
+            output_pdf = os.path.join(scratch_dir, pdf_name)
 
-    if not generate_pdf_from_docx(output_docx, output_pdf):
-        return "PDF generation failed", 500
+            success = generate_document(filename, data, output_docx, section)
+            if not success:
+                return "Template not found", 404
 
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(output_docx)
-            os.remove(output_pdf)
-        except:
-            pass
-        return response
-    return send_file(output_pdf, as_attachment=True)
+            if not generate_pdf_from_docx(output_docx, output_pdf):
+                return "PDF generation failed", 500
+            content = read_file(output_pdf)
+        output_cache.put(cache_key, content)
+
+    return send_file(io.BytesIO(content), as_attachment=True,
+                     download_name=pdf_name, mimetype='application/pdf')
 
 @app.route('/download_all_zip')
 def download_all_zip():
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
-    
-    zip_path = os.path.join(GENERATED_DIR, "All_Documents.zip")
-    generated_files = []
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for filename in doc_list:
-            output_name = f"Filled_{filename}"
-            output_path = os.path.join(GENERATED_DIR, output_name)
-            if generate_document(filename, data, output_path, section):
-                zipf.write(output_path, arcname=output_name)
-                generated_files.append(output_path)
-    
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(zip_path)
-            for f in generated_files:
-                try:
-                    os.remove(f)
-                except:
-                    pass
-        except:
-            pass
-        return response
-    return send_file(zip_path, as_attachment=True)
+    doc_list = section_templates(section)
+
+    return zip_response(render_batch(doc_list, data, section), "All_Documents.zip")
 
 @app.route('/download_all_pdf_zip')
 def download_all_pdf_zip():
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
-
-    zip_path = os.path.join(GENERATED_DIR, "All_Documents_PDF.zip")
-    generated_files = []
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for filename in doc_list:
-            output_docx = os.path.join(GENERATED_DIR, f"Filled_{filename}")
-            output_pdf = os.path.join(GENERATED_DIR, f"Filled_{os.path.splitext(filename)[0]}.pdf")
-            if generate_document(filename, data, output_docx, section):
-                if generate_pdf_from_docx(output_docx, output_pdf):
-                    zipf.write(output_pdf, arcname=os.path.basename(output_pdf))
-                    generated_files.extend([output_docx, output_pdf])
-
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(zip_path)
-            for f in generated_files:
-                try:
-                    os.remove(f)
-                except:
-                    pass
-        except:
-            pass
-        return response
-    return send_file(zip_path, as_attachment=True)
-
-@app.route('/download_merged')
-def download_merged():
-    data = load_data()
-    section = data.get('offence_section', 'GENERAL')
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
-    
-    if not doc_list:
-        return "No documents to merge", 400
+    doc_list = section_templates(section)
 
-    # Generate first document as base
-    base_path = os.path.join(GENERATED_DIR, "Merged_Master.docx")
-    generate_document(doc_list[0], data, base_path, section)
-    
-    master_doc = Document(base_path)
-    composer = Composer(master_doc)
-    
-    # Append subsequent documents
-    temp_files = []
-    for filename in doc_list[1:]:
-        temp_path = os.path.join(GENERATED_DIR, f"temp_{filename}")
-        generate_document(filename, data, temp_path, section)
-        doc_to_append = Document(temp_path)
-        master_doc.add_page_break()
-        composer.append(doc_to_append)
-        temp_files.append(temp_path)
-        
-    composer.save(base_path)
-    
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(base_path)
-            for f in temp_files:
-                try:
-                    os.remove(f)
-                except:
-                    pass
-        except:
-            pass
-        return response
-    return send_file(base_path, as_attachment=True)
+    return zip_response(render_batch(doc_list, data, section, to_pdf=True), "All_Documents_PDF.zip")
 
-@app.route('/download_merged_pdf')
-def download_merged_pdf():
+def merged_download(fmt):
+    """Shared body of the merged DOCX / PDF routes"""
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
+    doc_list = section_templates(section)
 
     if not doc_list:
         return "No documents to merge", 400
 
-    base_path = os.path.join(GENERATED_DIR, "Merged_Master.docx")
-    generate_document(doc_list[0], data, base_path, section)
+    try:
+        content = render_merged(doc_list, data, section, fmt)
+    except RuntimeError as e:
+        return str(e), 500
 
-    master_doc = Document(base_path)
-    composer = Composer(master_doc)
+    return send_file(io.BytesIO(content), as_attachment=True,
+                     download_name=f"Merged_Master.{fmt}",
+                     mimetype=DOCX_MIMETYPE if fmt == 'docx' else 'application/pdf')
 
-    temp_files = []
-    for filename in doc_list[1:]:
-        temp_path = os.path.join(GENERATED_DIR, f"temp_{filename}")
-        generate_document(filename, data, temp_path, section)
-        doc_to_append = Document(temp_path)
-        master_doc.add_page_break()
-        composer.append(doc_to_append)
-        temp_files.append(temp_path)
+@app.route('/download_merged')
+def download_merged():
+    return merged_download('docx')
 
-    composer.save(base_path)
+@app.route('/download_merged_pdf')
+def download_merged_pdf():
+    return merged_download('pdf')
 
-    merged_pdf = os.path.join(GENERATED_DIR, "Merged_Master.pdf")
-    if not generate_pdf_from_docx(base_path, merged_pdf):
-        return "PDF generation failed", 500
+# Ends every part of the streamed merged preview, so the page can insert each
+# one as it arrives without parsing half a part
+MERGED_PART_END = "<!--end-part-->\n"
 
-    @after_this_request
-    def cleanup(response):
-        try:
-            os.remove(base_path)
-            os.remove(merged_pdf)
-            for f in temp_files:
-                try:
-                    os.remove(f)
-                except:
-                    pass
-        except:
-            pass
-        return response
-    return send_file(merged_pdf, as_attachment=True)
+def preview_etag(template_path, data):
+    """Content hash a preview of this template with this data would have; None if it's missing"""
+    compiled = load_compiled_template(template_path)
+    if compiled is None:
+        return None
+    return template_cache_key(compiled, data, 'preview')
+
+def merged_preview_part(filename, preview_html):
+    return (f"<div class='merged-part' data-template='{html.escape(filename, quote=True)}' style='page-break-after: always; margin-bottom: 30px; padding-bottom: 20px; border-bottom: 3px solid #ccc;'>"
+            f"<h4 style='color: #003366; margin-bottom: 15px;'>📄 {html.escape(filename)}</h4>"
+            f"<div class='merged-part-body'>{preview_html}</div></div>")
 
 @app.route('/preview/<filename>')
 def preview_document(filename):
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
     template_path = get_template_path(filename, section)
-    
-    if not os.path.exists(template_path):
+
+    etag = preview_etag(template_path, data)
+    if etag is None:
         return "Template not found", 404
-    
-    preview_html = extract_preview_from_docx(template_path, data)
-    return preview_html
+    # The tag already covers template and data, so a match needs no rendering
+    return conditional_response(etag, lambda: extract_preview_from_docx(template_path, data))
 
 @app.route('/preview_merged')
 def preview_merged():
+    """Stream each template's preview, in section order, as soon as it is rendered"""
     data = load_data()
     section = data.get('offence_section', 'GENERAL')
-    doc_list = OFFENCE_MAPPING.get(section, OFFENCE_MAPPING['GENERAL'])
-    
-    merged_html = ""
-    for filename in doc_list:
+    parts = []
+    for filename in section_templates(section):
         template_path = get_template_path(filename, section)
-        if os.path.exists(template_path):
-            merged_html += f"<div style='page-break-after: always; margin-bottom: 30px; padding-bottom: 20px; border-bottom: 3px solid #ccc;'>"
-            merged_html += f"<h4 style='color: #003366; margin-bottom: 15px;'>📄 {filename}</h4>"
-            merged_html += extract_preview_from_docx(template_path, data)
-            merged_html += "</div>"
-    
-    if not merged_html:
+        etag = preview_etag(template_path, data)
+        if etag is not None:
+            parts.append((filename, template_path, etag))
+
+    if not parts:
         return "<p class='text-muted'>No documents to preview</p>"
-    
-    return merged_html
+
+    etag = hashlib.sha256(json.dumps([key for _f, _p, key in parts]).encode('utf-8')).hexdigest()
+
+    def render():
+        futures = [
+            (filename, _render_executor.submit(extract_preview_from_docx, template_path, data))
+            for filename, template_path, _key in parts
+        ]
+
+        def generate():
+            for filename, future in futures:
+                try:
+                    preview_html = future.result()
+                except Exception:
+                    app.logger.exception("Preview failed for %s", filename)
+                    preview_html = "<p class='text-danger'>Preview unavailable</p>"
+                yield merged_preview_part(filename, preview_html) + MERGED_PART_END
+
+        return generate()
+
+    return conditional_response(etag, render)
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+
+@app.cli.command('build-index')
+def build_index_command():
+    """Rebuild the placeholder manifest and report unknown tokens."""
+    index = refresh_placeholder_index()
+    for key, entry in sorted(index.items()):
+        print(f"{key}: {len(entry['placeholders'])} placeholders"
+              f" ({len(entry['split_placeholders'])} split across runs)")
+        for token in entry['unknown_tokens']:
+            print(f"  unknown token [{token}]")
+
+@app.cli.command('precompile')
+@click.option('--check', is_flag=True, help='Only report problems; write nothing.')
+def precompile_command(check):
+    """Lint templates and write copies with split placeholders merged into one run."""
+    if precompile_templates(check) and check:
+        sys.exit(1)
+
+@app.cli.command('bulk-generate')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_path', type=click.Path(dir_okay=False))
+@click.option('--workers', default=BULK_WORKERS, show_default=True, help='Worker processes.')
+def bulk_generate_command(input_path, output_path, workers):
+    """Render documents for every case in a CSV / JSON Lines file into one ZIP."""
+    failed = 0
+    def counted(results):
+        nonlocal failed
+        for result in results:
+            failed += bool(result.error)
+            yield result
+
+    with open(input_path, 'rb') as source, open(output_path, 'wb') as target:
+        records = iter_case_records(source, input_path)
+        for chunk in stream_zip(counted(bulk_render(records, workers))):
+            target.write(chunk)
+    print(f"Wrote {output_path}" + (f" ({failed} failed, see {FAILURE_REPORT_NAME})" if failed else ""))
+
+refresh_placeholder_index(write=False)
+startup_stats['import_seconds'] = round(time.perf_counter() - _import_started, 3)
 
 if __name__ == '__main__':
+    warm_up()
     app.run(debug=True, port=5000)
\ No newline at end of file
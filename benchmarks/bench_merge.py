@@ -0,0 +1,82 @@
+"""Benchmark: merged-document assembly as the number of parts grows.
+
+Run from the project root:
+
+    python benchmarks/bench_merge.py [max_parts]
+
+Compares the old route body (save each filled part to a temp file, reopen it
+and append it with a plain docxcompose Composer) with build_merged_document,
+which composes the in-memory parts directly. Reports wall time and the peak
+Python heap seen by tracemalloc.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+from docxcompose.composer import Composer
+
+import app
+
+SECTION = "281"
+SAMPLE_DATA = {key: f"<{key} value>" for key in app.REQUIRED_FIELDS}
+PART_COUNTS = [3, 5, 10, 20, 50]
+
+
+def doc_list(parts):
+    names = app.section_templates(SECTION)
+    return [names[i % len(names)] for i in range(parts)]
+
+
+def merge_via_disk(filenames):
+    """The pre-rewrite route body: every part round-trips through a temp file."""
+    with tempfile.TemporaryDirectory() as scratch:
+        base_path = os.path.join(scratch, "Merged_Master.docx")
+        app.generate_document(filenames[0], SAMPLE_DATA, base_path, SECTION)
+        master_doc = Document(base_path)
+        composer = Composer(master_doc)
+        for i, filename in enumerate(filenames[1:]):
+            temp_path = os.path.join(scratch, f"temp_{i}_{filename}")
+            app.generate_document(filename, SAMPLE_DATA, temp_path, SECTION)
+            master_doc.add_page_break()
+            composer.append(Document(temp_path))
+        composer.save(base_path)
+
+
+def merge_in_memory(filenames):
+    merged, failures = app.build_merged_document(filenames, SAMPLE_DATA, SECTION)
+    assert not failures, failures
+    merged.save(os.devnull)
+
+
+def measure(merge, filenames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    merge(filenames)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(max_parts=50):
+    # Compile templates up front so neither side pays the first parse
+    for filename in app.section_templates(SECTION):
+        app.load_compiled_template(app.get_template_path(filename, SECTION))
+
+    print(f"{'parts':>5}{'disk ms':>12}{'memory ms':>12}{'speedup':>10}"
+          f"{'disk peak MB':>15}{'memory peak MB':>17}")
+    for parts in [n for n in PART_COUNTS if n <= max_parts]:
+        filenames = doc_list(parts)
+        disk_time, disk_peak = measure(merge_via_disk, filenames)
+        mem_time, mem_peak = measure(merge_in_memory, filenames)
+        print(f"{parts:>5}{disk_time * 1000:>12.1f}{mem_time * 1000:>12.1f}"
+              f"{disk_time / mem_time:>9.1f}x{disk_peak / 2**20:>15.2f}{mem_peak / 2**20:>17.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,116 @@
+"""Micro-benchmark: single-pass placeholder substitution vs the old per-field rescan.
+
+Run from the project root:
+
+    python benchmarks/bench_substitution.py [repeat]
+
+Every paragraph of the bundled word_templates/281 documents is filled with both
+implementations; the resulting XML must be identical before timings are shown.
+"""
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+
+import app
+
+TEMPLATES = [
+    os.path.join(app.TEMPLATE_DIR, "281", name) for name in app.section_templates("281")
+]
+SAMPLE_DATA = {key: f"<{key} value>" for key in app.REQUIRED_FIELDS}
+
+
+def legacy_replace_text_in_paragraph(paragraph, data):
+    """The pre-rewrite implementation, kept verbatim as the reference."""
+    if not paragraph.runs:
+        return
+
+    for key in app.REQUIRED_FIELDS:
+        placeholder = f"[{key}]"
+        while True:
+            full_text = "".join(run.text for run in paragraph.runs)
+            idx = full_text.find(placeholder)
+            if idx == -1:
+                break
+
+            start = idx
+            end = idx + len(placeholder)
+            value = str(data.get(key, ""))
+
+            run_positions = []
+            pos = 0
+            for i, run in enumerate(paragraph.runs):
+                run_positions.append((i, pos, pos + len(run.text)))
+                pos += len(run.text)
+
+            start_run_idx = None
+            end_run_idx = None
+            start_offset = 0
+            end_offset = 0
+            for i, s, e in run_positions:
+                if start_run_idx is None and start >= s and start < e:
+                    start_run_idx = i
+                    start_offset = start - s
+                if end_run_idx is None and end > s and end <= e:
+                    end_run_idx = i
+                    end_offset = end - s
+                if start_run_idx is not None and end_run_idx is not None:
+                    break
+
+            if start_run_idx is None or end_run_idx is None:
+                break
+
+            if start_run_idx == end_run_idx:
+                run = paragraph.runs[start_run_idx]
+                run.text = run.text[:start_offset] + value + run.text[end_offset:]
+            else:
+                start_run = paragraph.runs[start_run_idx]
+                end_run = paragraph.runs[end_run_idx]
+                start_text = start_run.text
+                end_text = end_run.text
+                start_run.text = start_text[:start_offset] + value + end_text[end_offset:]
+                for i in range(start_run_idx + 1, end_run_idx + 1):
+                    paragraph.runs[i].text = ""
+
+
+def fill(doc, replace):
+    for p in doc.paragraphs:
+        replace(p, SAMPLE_DATA)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for p in cell.paragraphs:
+                    replace(p, SAMPLE_DATA)
+    return doc
+
+
+def time_fill(pristine, replace, repeat):
+    # Copies are made up front so only the substitution itself is timed
+    docs = [copy.deepcopy(pristine) for _ in range(repeat)]
+    start = time.perf_counter()
+    for doc in docs:
+        fill(doc, replace)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(repeat=200):
+    print(f"{'template':<28}{'legacy ms':>12}{'single-pass ms':>16}{'speedup':>10}")
+    for path in TEMPLATES:
+        pristine = Document(path)
+        expected = fill(copy.deepcopy(pristine), legacy_replace_text_in_paragraph)
+        actual = fill(copy.deepcopy(pristine), app.replace_text_in_paragraph)
+        if expected.element.xml != actual.element.xml:
+            sys.exit(f"{path}: output differs from the legacy implementation")
+
+        legacy = time_fill(pristine, legacy_replace_text_in_paragraph, repeat)
+        current = time_fill(pristine, app.replace_text_in_paragraph, repeat)
+        print(f"{os.path.basename(path):<28}{legacy * 1000:>12.3f}{current * 1000:>16.3f}"
+              f"{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,306 @@
+"""Benchmark suite: template filling, placeholder scan, preview, merge and PDF paths.
+
+Run from the project root:
+
+    python benchmarks/run.py [--sets 281,small,medium] [--iterations 20]
+                             [--pdf auto|stub|real] [--output results.json]
+                             [--compare previous.json]
+
+Synthetic templates of increasing size (paragraph count, table density and
+placeholders split over several runs) are generated into a scratch template
+directory next to a copy of word_templates/281, and the app is pointed at it.
+Library calls are timed directly; the download and preview routes go through
+Flask's test client. Each benchmark reports p50/p99 latency, throughput and
+the process's peak RSS so far, and the whole run is written as JSON, by
+default to benchmarks/results/<timestamp>.json (not tracked by git).
+
+The output cache is disabled (unless --cache) so every iteration does the
+work. With --pdf stub (the default when neither soffice nor unoserver is on
+PATH) office conversion is replaced by a stub that writes a one-page PDF, so
+the PDF routes measure everything but the converter itself.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from docx import Document
+
+import app
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+SAMPLE_DATA = {key: f"<{key} value>" for key in app.REQUIRED_FIELDS}
+
+# name -> (paragraphs, a 3x3 table after every n paragraphs (0 = none), runs per placeholder)
+SYNTHETIC_SETS = {
+    "small": (20, 0, 1),
+    "medium": (200, 20, 3),
+    "large": (1000, 10, 6),
+}
+TEMPLATES_PER_SET = 3
+
+
+def stub_pdf():
+    """A valid one-page A4 PDF (with xref table), so merged PDFs can join it"""
+    objects = [
+        b"<</Type/Catalog/Pages 2 0 R>>",
+        b"<</Type/Pages/Kids[3 0 R]/Count 1>>",
+        b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj%s endobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+STUB_PDF = stub_pdf()
+
+
+def split_text(text, pieces):
+    """Cut text into `pieces` roughly equal chunks (Word's split-run pattern)"""
+    pieces = max(1, min(pieces, len(text)))
+    size, extra = divmod(len(text), pieces)
+    chunks, start = [], 0
+    for i in range(pieces):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def synthetic_template(path, paragraphs, table_every, split_runs, offset=0):
+    doc = Document()
+    fields = app.REQUIRED_FIELDS
+    for i in range(paragraphs):
+        key = fields[(i + offset) % len(fields)]
+        p = doc.add_paragraph()
+        p.add_run(f"Paragraph {i}: ")
+        for chunk in split_text(f"[{key}]", split_runs):
+            p.add_run(chunk)
+        p.add_run(" followed by ordinary text that has no placeholders in it.")
+        if table_every and i % table_every == table_every - 1:
+            table = doc.add_table(rows=3, cols=3)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"[{fields[(i + r * 3 + c) % len(fields)]}]"
+    doc.save(path)
+
+
+def build_template_dir(root, sets):
+    """A TEMPLATE_DIR holding the requested sets, one section per set"""
+    manifest = {"sections": {}, "templates": {}}
+    for name in sets:
+        section_dir = os.path.join(root, name)
+        if name in SYNTHETIC_SETS:
+            os.makedirs(section_dir)
+            templates = []
+            for i in range(TEMPLATES_PER_SET):
+                filename = f"{name.capitalize()}_{i + 1}.docx"
+                synthetic_template(os.path.join(section_dir, filename), *SYNTHETIC_SETS[name], offset=i * 7)
+                templates.append(filename)
+            manifest["sections"][name] = {"label": name, "templates": templates}
+        else:
+            shutil.copytree(os.path.join(app.TEMPLATE_DIR, name), section_dir)
+    with open(app.REGISTRY_MANIFEST, encoding="utf-8") as f:
+        real = json.load(f)
+    for name in sets:
+        if name in real.get("sections", {}):
+            manifest["sections"][name] = real["sections"][name]
+    manifest["templates"] = real.get("templates", {})
+    with open(os.path.join(root, "offences.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+
+def stub_generate_pdfs(pairs):
+    for _docx_path, pdf_path in pairs:
+        with open(pdf_path, "wb") as f:
+            f.write(STUB_PDF)
+    return [True] * len(pairs)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, template_set, fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    total = time.perf_counter() - started
+    timings.sort()
+    result = {
+        "name": name,
+        "set": template_set,
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "throughput_per_s": round(iterations / total, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"{template_set:>8}  {name:<32}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+          f"{result['throughput_per_s']:>10.1f}{result['peak_rss_mb'] or 0:>10.1f}")
+    return result
+
+
+def route(client, path):
+    def call():
+        response = client.get(path)
+        response.get_data()
+        assert response.status_code == 200, f"{path}: {response.status_code}"
+    return call
+
+
+def run_set(template_set, iterations, warmup):
+    templates = app.section_templates(template_set)
+    paths = [app.get_template_path(f, template_set) for f in templates]
+    client = app.app.test_client()
+    client.post("/api/save_data", json=dict(SAMPLE_DATA, offence_section=template_set))
+
+    def fill_all():
+        for filename in templates:
+            app.generate_document(filename, SAMPLE_DATA, io.BytesIO(), template_set)
+
+    def scan_cold():
+        app._template_cache.clear()
+        for path in paths:
+            app.extract_placeholders_from_docx(path)
+
+    def preview_all():
+        for path in paths:
+            app.extract_preview_from_docx(path, SAMPLE_DATA)
+
+    benchmarks = [
+        ("generate_document", fill_all),
+        ("extract_placeholders (cold)", scan_cold),
+        ("extract_preview_from_docx", preview_all),
+        ("GET /download_single", route(client, f"/download_single/{templates[0]}")),
+        ("GET /download_all_zip", route(client, "/download_all_zip")),
+        ("GET /download_merged", route(client, "/download_merged")),
+        ("GET /preview_merged", route(client, "/preview_merged")),
+        ("GET /download_single_pdf", route(client, f"/download_single_pdf/{templates[0]}")),
+        ("GET /download_all_pdf_zip", route(client, "/download_all_pdf_zip")),
+        ("GET /download_merged_pdf", route(client, "/download_merged_pdf")),
+    ]
+    return [measure(name, template_set, fn, iterations, warmup) for name, fn in benchmarks]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(r["set"], r["name"]): r for r in json.load(f)["results"]}
+    print(f"\n{'set':>8}  {'benchmark':<32}{'p50 before':>12}{'p50 now':>10}{'change':>9}")
+    for r in results:
+        old = previous.get((r["set"], r["name"]))
+        if old and old["p50_ms"]:
+            change = (r["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+            print(f"{r['set']:>8}  {r['name']:<32}{old['p50_ms']:>12.2f}{r['p50_ms']:>10.2f}{change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sets", default="281,small,medium",
+                        help="comma-separated: 281 and/or " + ", ".join(SYNTHETIC_SETS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--pdf", choices=["auto", "stub", "real"], default="auto")
+    parser.add_argument("--cache", action="store_true", help="leave the output cache on")
+    parser.add_argument("--output", help="results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to compare p50 against")
+    args = parser.parse_args()
+    started = datetime.now(timezone.utc)
+    if args.output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        args.output = os.path.join(RESULTS_DIR, started.strftime("%Y%m%d-%H%M%S") + ".json")
+
+    sets = [s.strip() for s in args.sets.split(",") if s.strip()]
+    have_office = bool(shutil.which("soffice") or shutil.which("unoserver"))
+    pdf_mode = args.pdf if args.pdf != "auto" else ("real" if have_office else "stub")
+    if pdf_mode == "stub":
+        app.generate_pdfs_from_docx = stub_generate_pdfs
+    if not args.cache:
+        app.output_cache = app.OutputCache(0)
+
+    with tempfile.TemporaryDirectory() as root:
+        template_dir = os.path.join(root, "word_templates")
+        os.makedirs(template_dir)
+        build_template_dir(template_dir, sets)
+        app.TEMPLATE_DIR = template_dir
+        app.REGISTRY_MANIFEST = os.path.join(template_dir, "offences.json")
+        app._registry = None
+        app._template_cache.clear()
+
+        print(f"{'set':>8}  {'benchmark':<32}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'RSS MB':>10}")
+        results = []
+        for template_set in sets:
+            results.extend(run_set(template_set, args.iterations, args.warmup))
+
+    report = {
+        "meta": {
+            "timestamp": started.isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "pdf_converter": pdf_mode,
+            "direct_pdf_font": app.direct_pdf_font() is not None,
+            "output_cache": args.cache,
+            "synthetic_sets": {name: SYNTHETIC_SETS[name] for name in sets if name in SYNTHETIC_SETS},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Production serving profile:
+#
+#     gunicorn --config gunicorn.conf.py app:app
+#
+# The app is imported and warmed up once in the master process; workers are
+# forked afterwards and share the compiled templates copy-on-write. Settings
+# can be overridden with the environment variables below.
+#
+# Background jobs (/api/jobs) keep their state and results in a directory
+# every worker reads, so polls may land on any worker. Each worker gets its
+# own block of ports for its LibreOffice pool (see pre_fork).
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Threads per worker; generation releases the GIL in lxml and waits on the
+# PDF converters, so a few threads keep a worker busy
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+# Merged PDFs through a cold LibreOffice can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so a leak can't grow forever
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = 100
+accesslog = '-'
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker forks
+    import app as application
+
+    application.app.logger.setLevel(server.log.loglevel)
+    application.warm_up()
+    stats = application.startup_stats
+    server.log.info("Warm-up done: %d templates in %.2fs (import %.2fs)",
+                    stats['templates_compiled'], stats['warm_up_seconds'], stats['import_seconds'])
+    # Keep the warmed-up objects out of the collector so it doesn't touch
+    # (and un-share) their pages in every worker
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    # Lowest slot no live worker holds; a recycled worker's replacement reuses it
+    taken = {getattr(w, 'pdf_slot', None) for w in server.WORKERS.values()}
+    worker.pdf_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    # The converter pool starts lazily in the worker, after this
+    import app as application
+
+    application.PDF_WORKER_BASE_PORT += worker.pdf_slot * application.PDF_WORKERS